@@ -0,0 +1,227 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Nodes = Union[int, Sequence[int], np.ndarray]
+
+
+@dataclass(frozen=True, slots=True)
+class NodeSet:
+    label: str
+    key: str
+
+
+@dataclass(frozen=True, slots=True)
+class Relationship:
+    type: str
+    source: str
+    target: str
+
+
+# The graph written by create_nodes_parallel.py, plus the CITES edges.
+NODE_SETS: List[NodeSet] = [
+    NodeSet("Paper", "paperId"),
+    NodeSet("Author", "authorId"),
+    NodeSet("Venue", "venueId"),
+]
+
+RELATIONSHIPS: List[Relationship] = [
+    Relationship("IS_AUTHOR", "Author", "Paper"),
+    Relationship("WAS_PUBLISHED", "Paper", "Venue"),
+    Relationship("CITES", "Paper", "Paper"),
+]
+
+DIRECTIONS = ("out", "in", "both")
+
+
+def encode_ids(ids: Iterable[str]) -> np.ndarray:
+    "Sorted fixed-width byte strings, searchable with np.searchsorted."
+    encoded = np.array([id.encode("utf-8") for id in ids], dtype=np.bytes_)
+    return np.sort(encoded) if len(encoded) else np.array([], dtype="S1")
+
+
+def lookup(block: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    "Positions of `ids` in the sorted `block`, -1 where absent."
+    positions = np.searchsorted(block, ids)
+    found = positions < len(block)
+    found[found] = block[positions[found]] == ids[found]
+    return np.where(found, positions, -1)
+
+
+def edge_positions(
+    indptr: np.ndarray, nodes: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenated ranges indptr[node]:indptr[node + 1], built without a
+    Python loop, and the length of each range."""
+    starts = np.asarray(indptr[nodes])
+    lengths = np.asarray(indptr[nodes + 1]) - starts
+    shifts = starts - (np.cumsum(lengths) - lengths)
+    return np.arange(lengths.sum()) + np.repeat(shifts, lengths), lengths
+
+
+def write_csr(
+    directory: str,
+    prefix: str,
+    nodes: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    types: np.ndarray,
+) -> None:
+    "Save edges grouped by source as `{prefix}_indptr/indices/types.npy`."
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=nodes), out=indptr[1:])
+    dtype = np.int32 if nodes < 2**31 else np.int64
+    np.save(os.path.join(directory, f"{prefix}_indptr.npy"), indptr)
+    np.save(
+        os.path.join(directory, f"{prefix}_indices.npy"), targets[order].astype(dtype)
+    )
+    np.save(os.path.join(directory, f"{prefix}_types.npy"), types[order])
+
+
+class CsrGraph:
+    """Read-only snapshot of the graph written by `export_csr.py`.
+
+    Nodes are numbered in one index space, one contiguous block per label,
+    sorted by id within the block. Edges are stored twice in CSR form,
+    grouped by source (`out`) and by target (`in`), with the relationship
+    type of each edge in a parallel array. Every array is memory-mapped, so
+    opening a snapshot is instant and queries only touch the rows they
+    read."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "graph.json")) as file:
+            meta = json.load(file)
+        self.labels: List[dict] = meta["labels"]
+        self.types: List[str] = meta["types"]
+        self.ids = self._load("ids")
+        self.adjacency = {
+            direction: tuple(
+                self._load(f"{direction}_{part}")
+                for part in ("indptr", "indices", "types")
+            )
+            for direction in ("out", "in")
+        }
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edges(self) -> int:
+        return len(self.adjacency["out"][1])
+
+    def _block(self, label: str) -> dict:
+        for block in self.labels:
+            if block["label"] == label:
+                return block
+        raise KeyError(f"No {label} nodes in {self.directory}")
+
+    def nodes(self, label: str) -> np.ndarray:
+        "Indices of every node with `label`."
+        block = self._block(label)
+        return np.arange(block["start"], block["end"])
+
+    def index(self, ids: Union[str, Iterable[str]], label: str) -> np.ndarray:
+        "Indices of the `label` nodes with these ids, -1 for unknown ids."
+        if isinstance(ids, str):
+            ids = [ids]
+        block = self._block(label)
+        wanted = np.array([id.encode("utf-8") for id in ids], dtype=np.bytes_)
+        positions = lookup(self.ids[block["start"] : block["end"]], wanted)
+        return np.where(positions >= 0, positions + block["start"], -1)
+
+    def id(self, nodes: Nodes) -> List[str]:
+        return [id.decode("utf-8") for id in np.atleast_1d(self.ids[nodes])]
+
+    def label(self, nodes: Nodes) -> np.ndarray:
+        "Label of each node."
+        starts = np.array([block["start"] for block in self.labels])
+        names = np.array([block["label"] for block in self.labels])
+        return names[np.searchsorted(starts, nodes, side="right") - 1]
+
+    def _edges(self, nodes: np.ndarray, direction: str, types: Optional[Iterable[str]]):
+        "Yield `(owner, neighbour)` arrays, one pair per stored direction."
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+        mask = None
+        if types is not None:
+            mask = np.zeros(len(self.types), dtype=bool)
+            mask[[self.types.index(type) for type in types]] = True
+        for stored in ("out", "in"):
+            if direction not in (stored, "both"):
+                continue
+            indptr, indices, edge_types = self.adjacency[stored]
+            positions, lengths = edge_positions(indptr, nodes)
+            owners = np.repeat(np.arange(len(nodes)), lengths)
+            neighbours = np.asarray(indices[positions])
+            if mask is not None:
+                keep = mask[np.asarray(edge_types[positions])]
+                owners, neighbours = owners[keep], neighbours[keep]
+            yield owners, neighbours
+
+    def degree(
+        self,
+        nodes: Nodes,
+        direction: str = "both",
+        types: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        "Number of edges of each node, optionally of the given types only."
+        nodes = np.atleast_1d(np.asarray(nodes, dtype=np.int64))
+        degrees = np.zeros(len(nodes), dtype=np.int64)
+        if types is None:
+            for stored in ("out", "in"):
+                if direction in (stored, "both"):
+                    indptr = self.adjacency[stored][0]
+                    degrees += np.asarray(indptr[nodes + 1]) - np.asarray(indptr[nodes])
+            return degrees
+        for owners, _ in self._edges(nodes, direction, types):
+            degrees += np.bincount(owners, minlength=len(nodes))
+        return degrees
+
+    def neighbors(
+        self,
+        nodes: Nodes,
+        direction: str = "both",
+        types: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        "Sorted distinct neighbours of a node, or of a set of nodes together."
+        nodes = np.atleast_1d(np.asarray(nodes, dtype=np.int64))
+        found = [neighbours for _, neighbours in self._edges(nodes, direction, types)]
+        return np.unique(np.concatenate(found)).astype(np.int64)
+
+    def k_hop(
+        self,
+        nodes: Nodes,
+        k: int,
+        direction: str = "both",
+        types: Optional[Iterable[str]] = None,
+        label: Optional[str] = None,
+    ) -> np.ndarray:
+        """Sorted nodes at most `k` hops from `nodes`, the seeds excluded,
+        optionally only those with `label`. Each hop expands the whole
+        frontier at once."""
+        frontier = np.unique(np.atleast_1d(np.asarray(nodes, dtype=np.int64)))
+        visited = np.zeros(len(self), dtype=bool)
+        visited[frontier] = True
+        reached = []
+        for _ in range(k):
+            frontier = self.neighbors(frontier, direction, types)
+            frontier = frontier[~visited[frontier]]
+            if not len(frontier):
+                break
+            visited[frontier] = True
+            reached.append(frontier)
+        if not reached:
+            return np.array([], dtype=np.int64)
+        result = np.sort(np.concatenate(reached))
+        if label is not None:
+            block = self._block(label)
+            result = result[(result >= block["start"]) & (result < block["end"])]
+        return result
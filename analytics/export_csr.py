@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from neo4j import AsyncDriver, AsyncGraphDatabase
+
+from analytics.csr import (
+    NODE_SETS,
+    RELATIONSHIPS,
+    NodeSet,
+    Relationship,
+    encode_ids,
+    lookup,
+    write_csr,
+)
+from analytics.query import edges_page_query, nodes_page_query
+from ingestion.paging import iter_pages
+from ingestion.query_registry import registry
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+
+if not NEO4J_URI:
+    raise ValueError("Missing NEO4J_URI in environment")
+
+registry.register("csr_nodes_page", nodes_page_query)
+registry.register("csr_edges_page", edges_page_query)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Snapshot the Paper/Author/Venue graph into memory-mapped CSR arrays"
+    )
+    parser.add_argument("destination", type=str, help="Destination folder")
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=10000,
+        help="Nodes read per transaction",
+    )
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        choices=[relationship.type for relationship in RELATIONSHIPS],
+        default=[relationship.type for relationship in RELATIONSHIPS],
+        help="Relationship types exported",
+    )
+    return parser.parse_args()
+
+
+async def export_nodes(
+    driver: AsyncDriver, node_set: NodeSet, page_size: int
+) -> np.ndarray:
+    ids: List[str] = []
+    pages = iter_pages(
+        driver,
+        NEO4J_DATABASE,
+        "csr_nodes_page",
+        "id",
+        "",
+        page_size,
+        label=node_set.label,
+        property=node_set.key,
+    )
+    async for rows in pages:
+        ids.extend(row["id"] for row in rows)
+    return encode_ids(ids)
+
+
+async def export_edges(
+    driver: AsyncDriver,
+    relationship: Relationship,
+    blocks: Dict[str, Tuple[int, np.ndarray]],
+    page_size: int,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Return the source and target indices of every `relationship` edge,
+    and how many edges had an endpoint missing from the node snapshot."""
+    keys = {node_set.label: node_set.key for node_set in NODE_SETS}
+    source_start, source_ids = blocks[relationship.source]
+    target_start, target_ids = blocks[relationship.target]
+    sources: List[np.ndarray] = []
+    targets: List[np.ndarray] = []
+    missing = 0
+    pages = iter_pages(
+        driver,
+        NEO4J_DATABASE,
+        "csr_edges_page",
+        "source",
+        "",
+        page_size,
+        type=relationship.type,
+        source_label=relationship.source,
+        source_property=keys[relationship.source],
+        target_label=relationship.target,
+        target_property=keys[relationship.target],
+    )
+    async for rows in pages:
+        page_sources = np.array(
+            [row["source"].encode("utf-8") for row in rows for _ in row["targets"]],
+            dtype=np.bytes_,
+        )
+        page_targets = np.array(
+            [target.encode("utf-8") for row in rows for target in row["targets"]],
+            dtype=np.bytes_,
+        )
+        source = lookup(source_ids, page_sources)
+        target = lookup(target_ids, page_targets)
+        # Nodes created after their label was exported.
+        known = (source >= 0) & (target >= 0)
+        missing += int((~known).sum())
+        sources.append(source[known] + source_start)
+        targets.append(target[known] + target_start)
+    empty = np.array([], dtype=np.int64)
+    return (
+        np.concatenate(sources) if sources else empty,
+        np.concatenate(targets) if targets else empty,
+        missing,
+    )
+
+
+async def export(args: argparse.Namespace) -> Dict[str, int]:
+    os.makedirs(args.destination, exist_ok=True)
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
+    ) as driver:
+        blocks: Dict[str, Tuple[int, np.ndarray]] = {}
+        labels = []
+        start = 0
+        for node_set in NODE_SETS:
+            ids = await export_nodes(driver, node_set, args.page_size)
+            blocks[node_set.label] = (start, ids)
+            labels.append(
+                {
+                    "label": node_set.label,
+                    "key": node_set.key,
+                    "start": start,
+                    "end": start + len(ids),
+                }
+            )
+            start += len(ids)
+            print(f"Exported {len(ids)} {node_set.label} nodes")
+        nodes = start
+
+        types = [t.type for t in RELATIONSHIPS if t.type in args.types]
+        edges: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        counts: Dict[str, int] = {}
+        for relationship in RELATIONSHIPS:
+            if relationship.type not in types:
+                continue
+            sources, targets, missing = await export_edges(
+                driver, relationship, blocks, args.page_size
+            )
+            code = np.full(len(sources), types.index(relationship.type), np.uint8)
+            edges.append((sources, targets, code))
+            counts[relationship.type] = len(sources)
+            print(f"Exported {len(sources)} {relationship.type} edges")
+            if missing:
+                print(f"Skipped {missing} {relationship.type} edges to newer nodes")
+
+    width = max(ids.dtype.itemsize for _, ids in blocks.values())
+    np.save(
+        os.path.join(args.destination, "ids.npy"),
+        np.concatenate([ids for _, ids in blocks.values()]).astype(f"S{width}"),
+    )
+    sources, targets, codes = (np.concatenate(parts) for parts in zip(*edges))
+    write_csr(args.destination, "out", nodes, sources, targets, codes)
+    write_csr(args.destination, "in", nodes, targets, sources, codes)
+    # Written last: a snapshot without graph.json is incomplete.
+    with open(os.path.join(args.destination, "graph.json"), "w") as file:
+        json.dump(
+            {"labels": labels, "types": types, "nodes": nodes, "edges": len(sources)},
+            file,
+            indent=2,
+        )
+    return {"nodes": nodes, **counts}
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    counts = asyncio.run(export(args))
+    print(f"Exported {counts} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
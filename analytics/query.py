@@ -0,0 +1,29 @@
+def nodes_page_query(label: str, property: str):
+    return f"""
+    MATCH (node:{label})
+    WHERE node.{property} > $after
+    RETURN node.{property} AS id
+    ORDER BY node.{property}
+    LIMIT $limit
+    """
+
+
+def edges_page_query(
+    type: str,
+    source_label: str,
+    source_property: str,
+    target_label: str,
+    target_property: str,
+):
+    # Pages are keyed on the source node, so every page is an index range
+    # scan and carries all the outgoing edges of its nodes.
+    return f"""
+    MATCH (source:{source_label})
+    WHERE source.{source_property} > $after
+    WITH source
+    ORDER BY source.{source_property}
+    LIMIT $limit
+    OPTIONAL MATCH (source)-[:{type}]->(target:{target_label})
+    RETURN source.{source_property} AS source, collect(target.{target_property}) AS targets
+    ORDER BY source
+    """
@@ -0,0 +1,297 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Below this many vectors a brute-force scan is as fast as probing lists.
+MIN_TRAIN_SIZE = 10_000
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def kmeans(
+    vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    "Spherical k-means; returns unit-length centroids."
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=clusters) == 0
+        # Empty clusters are reseeded with random vectors.
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class AnnIndex:
+    """Inverted-file (IVF) index over unit-length float32 vectors, searched
+    by inner product, i.e. cosine similarity.
+
+    Vectors and their list assignments live in memory-mapped files in
+    `directory` that grow as chunks are added, so the index opens instantly
+    and only the probed rows are paged in. Training rewrites the rows in
+    list order, so probing a list scores one contiguous slice; rows added
+    since are appended and kept in small per-list overflows until the next
+    training. Until it is trained, or while it is small, searches scan
+    every vector.
+
+    Training writes the reordered rows, ids and centroids to new files of
+    the next generation; replacing meta.json switches to them in one step,
+    so an interrupted training leaves the previous generation intact."""
+
+    FILES = ("vectors.f32", "assignments.i32", "ids.txt", "centroids.npy")
+
+    def __init__(self, directory: str, dimensions: Optional[int] = None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                meta = json.load(file)
+            if dimensions is not None and dimensions != meta["dimensions"]:
+                raise ValueError(
+                    f"{directory} holds {meta['dimensions']}-dimensional vectors, not {dimensions}"
+                )
+        elif dimensions is None:
+            raise ValueError(f"No index in {directory}; its dimensions are required")
+        else:
+            meta = {"dimensions": dimensions, "count": 0, "capacity": 0, "clustered": 0}
+        self.generation: int = meta.get("generation", 0)
+        self._remove_stale()
+        self.dimensions: int = meta["dimensions"]
+        self.count: int = meta["count"]
+        self.capacity: int = meta["capacity"]
+        # Rows [0, clustered) are sorted by list.
+        self.clustered: int = meta["clustered"]
+
+        self.ids: List[str] = []
+        ids_path = self._path("ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path, encoding="utf-8") as file:
+                lines = file.read().splitlines()
+            self.ids = lines[: self.count]
+            # Lines past `count` come from an add that was never saved.
+            if len(lines) != len(self.ids):
+                self._write_ids()
+        self.positions: Dict[str, int] = {id: row for row, id in enumerate(self.ids)}
+
+        self.vectors = self._open("vectors.f32", np.float32, self.dimensions)
+        self.assignments = self._open("assignments.i32", np.int32, 1)
+        centroids_path = self._path("centroids.npy")
+        self.centroids: Optional[np.ndarray] = (
+            np.load(centroids_path) if os.path.exists(centroids_path) else None
+        )
+        self._build_lists()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.positions
+
+    def _path(self, name: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        if generation:
+            name = f"{name}.{generation}"
+        return os.path.join(self.directory, name)
+
+    def _remove_stale(self) -> None:
+        "Delete files left by other generations or interrupted writes."
+        current = {self._path(name) for name in self.FILES}
+        for file in os.listdir(self.directory):
+            path = os.path.join(self.directory, file)
+            if file.startswith(self.FILES) and path not in current:
+                os.remove(path)
+
+    def _open(self, name: str, dtype, columns: int) -> Optional[np.memmap]:
+        if not self.capacity:
+            return None
+        return np.memmap(
+            self._path(name),
+            dtype=dtype,
+            mode="r+",
+            shape=(self.capacity, columns),
+        )
+
+    def _grow(self, needed: int) -> None:
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+        for name, dtype, columns in (
+            ("vectors.f32", np.float32, self.dimensions),
+            ("assignments.i32", np.int32, 1),
+        ):
+            with open(self._path(name), "ab") as file:
+                file.truncate(capacity * columns * np.dtype(dtype).itemsize)
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.assignments.flush()
+        self.capacity = capacity
+        self.vectors = self._open("vectors.f32", np.float32, self.dimensions)
+        self.assignments = self._open("assignments.i32", np.int32, 1)
+
+    def _build_lists(self) -> None:
+        if self.centroids is None:
+            self.bounds = np.zeros(1, dtype=np.int64)
+            self.overflow: List[np.ndarray] = []
+            return
+        lists = len(self.centroids)
+        self.bounds = np.searchsorted(
+            self.assignments[: self.clustered, 0], np.arange(lists + 1)
+        )
+        tail = self.assignments[self.clustered : self.count, 0]
+        order = np.argsort(tail, kind="stable")
+        edges = np.searchsorted(tail[order], np.arange(lists + 1))
+        self.overflow = [
+            self.clustered + order[start:end]
+            for start, end in zip(edges[:-1], edges[1:])
+        ]
+
+    def add(self, ids: Iterable[str], vectors: np.ndarray) -> int:
+        "Append the vectors of ids not yet indexed; returns how many were added."
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(
+            len(ids), self.dimensions
+        )
+        new = [row for row, id in enumerate(ids) if id not in self.positions]
+        new = list({ids[row]: row for row in new}.values())
+        if not new:
+            return 0
+        start = self.count
+        self._grow(start + len(new))
+        rows = normalize(vectors[new])
+        self.vectors[start : start + len(new)] = rows
+        if self.centroids is not None:
+            assignments = np.argmax(rows @ self.centroids.T, axis=1)
+            self.assignments[start : start + len(new), 0] = assignments
+            for cluster in np.unique(assignments):
+                added = start + np.flatnonzero(assignments == cluster)
+                self.overflow[cluster] = np.concatenate([self.overflow[cluster], added])
+        for row in new:
+            self.positions[ids[row]] = len(self.ids)
+            self.ids.append(ids[row])
+        self.count += len(new)
+        return len(new)
+
+    def train(
+        self,
+        lists: Optional[int] = None,
+        sample: int = 100_000,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> None:
+        """Cluster a sample of the vectors into `lists` lists, then rewrite
+        every row in list order and save the index."""
+        if not self.count:
+            return
+        lists = lists or max(1, int(np.sqrt(self.count)))
+        lists = min(lists, self.count)
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(self.count, min(sample, self.count), replace=False))
+        self.centroids = kmeans(np.asarray(self.vectors[rows]), lists, iterations, seed)
+        assignments = np.empty(self.count, dtype=np.int32)
+        for start in range(0, self.count, 65_536):
+            end = min(self.count, start + 65_536)
+            assignments[start:end] = np.argmax(
+                self.vectors[start:end] @ self.centroids.T, axis=1
+            )
+        order = np.argsort(assignments, kind="stable")
+
+        generation = self.generation + 1
+        ordered = np.memmap(
+            self._path("vectors.f32", generation),
+            dtype=np.float32,
+            mode="w+",
+            shape=(self.capacity, self.dimensions),
+        )
+        for start in range(0, self.count, 65_536):
+            rows = order[start : start + 65_536]
+            ordered[start : start + len(rows)] = self.vectors[rows]
+        ordered.flush()
+        del ordered
+        ordered = np.memmap(
+            self._path("assignments.i32", generation),
+            dtype=np.int32,
+            mode="w+",
+            shape=(self.capacity, 1),
+        )
+        ordered[: self.count, 0] = assignments[order]
+        ordered.flush()
+        del ordered
+        with open(self._path("centroids.npy", generation), "wb") as file:
+            np.save(file, self.centroids)
+
+        # save() writes the ids and then meta.json, which commits the switch.
+        self.ids = [self.ids[row] for row in order]
+        self.positions = {id: row for row, id in enumerate(self.ids)}
+        self.vectors = self.assignments = None
+        self.generation = generation
+        self.clustered = self.count
+        self.save()
+        self._remove_stale()
+        self.vectors = self._open("vectors.f32", np.float32, self.dimensions)
+        self.assignments = self._open("assignments.i32", np.int32, 1)
+        self._build_lists()
+
+    def search(
+        self, query: np.ndarray, k: int = 10, probes: int = 8
+    ) -> List[Tuple[str, float]]:
+        "Return the `k` most similar ids with their cosine similarity."
+        if not self.count:
+            return []
+        query = normalize(query).reshape(self.dimensions)
+        if self.centroids is None or self.count < MIN_TRAIN_SIZE:
+            candidates = None
+            scores = self.vectors[: self.count] @ query
+        else:
+            probes = min(probes, len(self.centroids))
+            nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+            parts, rows = [], []
+            for cluster in nearest:
+                start, end = self.bounds[cluster], self.bounds[cluster + 1]
+                parts.append(self.vectors[start:end] @ query)
+                rows.append(np.arange(start, end))
+                if len(self.overflow[cluster]):
+                    parts.append(self.vectors[self.overflow[cluster]] @ query)
+                    rows.append(self.overflow[cluster])
+            scores = np.concatenate(parts)
+            candidates = np.concatenate(rows)
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+        return [(self.ids[row], float(scores[index])) for row, index in zip(rows, top)]
+
+    def _write_ids(self) -> None:
+        path = self._path("ids.txt")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.writelines(id + "\n" for id in self.ids)
+        os.replace(path + ".tmp", path)
+
+    def save(self) -> None:
+        "Write the ids, then meta.json, so a saved count never exceeds the ids."
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.assignments.flush()
+        self._write_ids()
+        meta = {
+            "dimensions": self.dimensions,
+            "count": self.count,
+            "capacity": self.capacity,
+            "clustered": self.clustered,
+            "generation": self.generation,
+        }
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(path + ".tmp", path)
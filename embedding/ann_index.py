@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from neo4j import AsyncDriver, AsyncGraphDatabase
+
+from embedding.ann import MIN_TRAIN_SIZE, AnnIndex
+from embedding.backends import BACKENDS, create_backend
+from embedding.query import (
+    chunk_embeddings_query,
+    chunk_papers_query,
+    chunks_with_embedding_page_query,
+)
+from ingestion.metrics import metrics
+from ingestion.paging import iter_pages
+from ingestion.query_registry import registry
+from ingestion.utils import batched
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+
+if not NEO4J_URI:
+    raise ValueError("Missing NEO4J_URI in environment")
+
+registry.register("chunks_with_embedding_page", chunks_with_embedding_page_query)
+registry.register("chunk_embeddings", chunk_embeddings_query)
+registry.register("chunk_papers", chunk_papers_query)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Keep a local ANN index of chunk embeddings in sync with Neo4j and search it"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser(
+        "sync", help="Add the chunks embedded since the last sync"
+    )
+    sync.add_argument("index", help="Index directory")
+    sync.add_argument(
+        "--page-size",
+        type=int,
+        default=5000,
+        help="Chunk ids read per transaction",
+    )
+    sync.add_argument(
+        "--fetch-size",
+        type=int,
+        default=500,
+        help="Embeddings of new chunks read per transaction",
+    )
+    sync.add_argument(
+        "--train",
+        action="store_true",
+        help=f"Recluster the index (done automatically once it reaches {MIN_TRAIN_SIZE} chunks)",
+    )
+    sync.add_argument(
+        "--lists",
+        type=int,
+        default=None,
+        help="Inverted lists when training (defaults to the square root of the chunk count)",
+    )
+
+    search = commands.add_parser("search", help="Return the chunks nearest to a text")
+    search.add_argument("index", help="Index directory")
+    search.add_argument("text", help="Text to search for")
+    search.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="sentence-transformers",
+        help="Backend that embedded the chunks",
+    )
+    search.add_argument("--model", type=str, default=None, help="Backend model name")
+    search.add_argument("-k", type=int, default=10, help="Chunks returned")
+    search.add_argument(
+        "--probes",
+        type=int,
+        default=8,
+        help="Inverted lists scanned; more is slower and more exact",
+    )
+    search.add_argument(
+        "--expand",
+        action="store_true",
+        help="Read the text and paper of each hit from Neo4j",
+    )
+    return parser.parse_args(argv)
+
+
+async def read_chunk_embeddings_tx(tx, ids: List[str]) -> List[dict]:
+    result = await tx.run(registry.get("chunk_embeddings"), ids=ids)
+    return await result.data()
+
+
+async def read_chunk_papers_tx(tx, ids: List[str]) -> List[dict]:
+    result = await tx.run(registry.get("chunk_papers"), ids=ids)
+    return await result.data()
+
+
+async def sync_index(
+    driver: AsyncDriver, directory: str, args: argparse.Namespace
+) -> Optional[AnnIndex]:
+    """Add the embeddings of chunks missing from the index. Only chunk ids
+    are scanned; vectors are read for the new chunks alone.
+
+    The index is append-only: a chunk that is re-embedded keeps its first
+    vector, and deleted chunks stay in it. Deleted ones are counted and
+    reported; rebuild the index (remove its directory and sync) to drop
+    them or pick up new vectors."""
+    index = None
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        index = AnnIndex(directory)
+    added = 0
+    present = 0
+    pages = iter_pages(
+        driver,
+        NEO4J_DATABASE,
+        "chunks_with_embedding_page",
+        "chunkId",
+        "",
+        args.page_size,
+    )
+    try:
+        async for chunks in pages:
+            new = [
+                chunk["chunkId"]
+                for chunk in chunks
+                if index is None or chunk["chunkId"] not in index
+            ]
+            present += len(chunks) - len(new)
+            for ids in batched(new, args.fetch_size):
+                async with driver.session(database=NEO4J_DATABASE) as session:
+                    with metrics.time("read"):
+                        rows = await session.read_transaction(
+                            read_chunk_embeddings_tx, ids
+                        )
+                if not rows:
+                    continue
+                vectors = np.array([row["vector"] for row in rows], dtype=np.float32)
+                if index is None:
+                    index = AnnIndex(directory, vectors.shape[1])
+                added += index.add([row["chunkId"] for row in rows], vectors)
+            if new:
+                print(
+                    f"Indexed {added} new chunks, up to chunkId {chunks[-1]['chunkId']}"
+                )
+    finally:
+        # Keeps what was added if the sync is interrupted.
+        if index is not None:
+            index.save()
+    if index is None:
+        print("No embedded chunks to index")
+        return None
+    if args.train or (index.centroids is None and len(index) >= MIN_TRAIN_SIZE):
+        with metrics.time("train"):
+            index.train(args.lists)
+        print(f"Clustered {len(index)} chunks into {len(index.centroids)} lists")
+    print(f"Added {added} chunks, the index holds {len(index)}")
+    stale = len(index) - added - present
+    if stale:
+        print(f"{stale} indexed chunks are no longer embedded; rebuild the index to drop them")
+    return index
+
+
+async def expand_hits(driver: AsyncDriver, ids: List[str]) -> dict:
+    async with driver.session(database=NEO4J_DATABASE) as session:
+        rows = await session.read_transaction(read_chunk_papers_tx, ids)
+    return {row["chunkId"]: row for row in rows}
+
+
+async def sync(args: argparse.Namespace) -> None:
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
+    ) as driver:
+        await sync_index(driver, args.index, args)
+
+
+async def search(args: argparse.Namespace) -> None:
+    index = AnnIndex(args.index)
+    backend = create_backend(args.backend, args.model)
+    if backend.dimensions != index.dimensions:
+        raise ValueError(
+            f"{backend.key} embeds into {backend.dimensions} dimensions, the index holds {index.dimensions}"
+        )
+    query = backend.embed([args.text])[0]
+    start = time.perf_counter()
+    hits = index.search(query, args.k, args.probes)
+    elapsed = time.perf_counter() - start
+    print(f"{len(hits)} of {len(index)} chunks in {elapsed * 1000:.2f} ms")
+
+    # Neo4j is only needed to expand the hits into their text and paper.
+    chunks = {}
+    if args.expand and hits:
+        async with AsyncGraphDatabase.driver(
+            NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
+        ) as driver:
+            chunks = await expand_hits(driver, [id for id, _ in hits])
+    for id, score in hits:
+        print(f"{score:.4f}\t{id}")
+        if id in chunks:
+            print(f"\t{chunks[id]['paperId']}\t{chunks[id]['title']}")
+            print(f"\t{chunks[id]['text'][:200]}")
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.command == "sync":
+        asyncio.run(sync(args))
+    else:
+        asyncio.run(search(args))
+
+
+if __name__ == "__main__":
+    main()
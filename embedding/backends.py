@@ -0,0 +1,137 @@
+import re
+from abc import ABC, abstractmethod
+from hashlib import blake2b
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingBackend(ABC):
+    """Turns a batch of texts into a float32 matrix, one row per text.
+
+    `key` identifies the model so that cached vectors of different models
+    never mix."""
+
+    name = ""
+
+    def __init__(self, model: str, batch_size: int = 64):
+        self.model = model
+        self.batch_size = batch_size
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    @property
+    @abstractmethod
+    def dimensions(self) -> int: ...
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray: ...
+
+
+class HashingBackend(EmbeddingBackend):
+    """Signed feature hashing of word unigrams and bigrams. Needs no model
+    or network, so it suits offline runs and benchmarks, at the cost of
+    purely lexical similarity."""
+
+    name = "hashing"
+
+    def __init__(self, model: str = "384", batch_size: int = 64):
+        super().__init__(model, batch_size)
+        self.size = int(model)
+
+    @property
+    def dimensions(self) -> int:
+        return self.size
+
+    def _features(self, text: str) -> List[int]:
+        words = re.findall(r"\w+", text.lower())
+        tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [
+            int.from_bytes(blake2b(token.encode("utf-8"), digest_size=8).digest())
+            for token in tokens
+        ]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.size), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = np.array(self._features(text), dtype=np.uint64)
+            if not len(features):
+                continue
+            columns = (features % self.size).astype(np.intp)
+            signs = np.where(features >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], columns, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    "A local sentence-transformers model run on the CPU."
+
+    name = "sentence-transformers"
+
+    def __init__(self, model: str = "all-MiniLM-L6-v2", batch_size: int = 64):
+        super().__init__(model, batch_size)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "The sentence-transformers backend requires the sentence-transformers package"
+            )
+        self.encoder = SentenceTransformer(model, device="cpu")
+
+    @property
+    def dimensions(self) -> int:
+        return self.encoder.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.encoder.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32)
+
+
+class OpenAIBackend(EmbeddingBackend):
+    "OpenAI embeddings, the model genai.vector.encode used in the notebook."
+
+    name = "openai"
+
+    DIMENSIONS: Dict[str, int] = {
+        "text-embedding-ada-002": 1536,
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+    }
+
+    def __init__(self, model: str = "text-embedding-ada-002", batch_size: int = 64):
+        super().__init__(model, batch_size)
+        from langchain_openai import OpenAIEmbeddings
+
+        self.client = OpenAIEmbeddings(model=model, chunk_size=batch_size)
+        self._dimensions: Optional[int] = self.DIMENSIONS.get(model)
+
+    @property
+    def dimensions(self) -> int:
+        if self._dimensions is None:
+            self._dimensions = len(self.client.embed_query("dimensions"))
+        return self._dimensions
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.array(self.client.embed_documents(texts), dtype=np.float32)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HashingBackend, SentenceTransformerBackend, OpenAIBackend)
+}
+
+
+def create_backend(
+    name: str, model: Optional[str] = None, batch_size: int = 64
+) -> EmbeddingBackend:
+    backend = BACKENDS[name]
+    if model is None:
+        return backend(batch_size=batch_size)
+    return backend(model, batch_size)
@@ -0,0 +1,64 @@
+import sqlite3
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+def text_hash(text: str) -> bytes:
+    return blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed on the embedding model and the
+    hash of the embedded text, so identical chunk texts are embedded once
+    even after re-chunking."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_many(self, model: str, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay below SQLite's default limit of 999 bound parameters.
+        for start in range(0, len(unique), 900):
+            chunk = unique[start : start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            for digest, vector in self.connection.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model, *chunk],
+            ):
+                found[digest] = np.frombuffer(vector, dtype=np.float32)
+        self.hits += sum(1 for digest in hashes if digest in found)
+        self.misses += sum(1 for digest in hashes if digest not in found)
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                    for digest, vector in items
+                ],
+            )
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{rate:.1%} hit rate ({self.hits} texts not re-embedded)"
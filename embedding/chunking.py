@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import List
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+MAX_CHUNKS = 20
+
+
+@lru_cache(maxsize=None)
+def text_splitter(
+    chunk_size: int, chunk_overlap: int
+) -> RecursiveCharacterTextSplitter:
+    "One splitter per process and configuration."
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+
+def chunk_id(paper_id: str, key: str, seq_id: int) -> str:
+    return f"{paper_id}-{key}-chunk{seq_id:04d}"
+
+
+def split_paper_abstract(
+    paper: dict,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    max_chunks: int = MAX_CHUNKS,
+) -> List[dict]:
+    "Chunk rows for the abstract of one paper, at most `max_chunks` of them."
+    texts = text_splitter(chunk_size, chunk_overlap).split_text(paper["abstract"])
+    return [
+        {
+            "chunkId": chunk_id(paper["paperId"], "abstract", seq_id),
+            "paperId": paper["paperId"],
+            "key": "abstract",
+            "chunkSeqId": seq_id,
+            "text": text,
+            "title": paper["title"],
+            "source": paper["paperId"],
+        }
+        for seq_id, text in enumerate(texts[:max_chunks])
+    ]
+
+
+def chunk_papers(
+    papers: List[dict],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    max_chunks: int = MAX_CHUNKS,
+) -> List[dict]:
+    "Chunk a page of papers; runs in worker processes when a pool is used."
+    rows: List[dict] = []
+    for paper in papers:
+        rows.extend(split_paper_abstract(paper, chunk_size, chunk_overlap, max_chunks))
+    return rows
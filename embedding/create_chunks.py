@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import AsyncGenerator, Deque, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from neo4j import AsyncGraphDatabase
+
+from embedding.chunking import CHUNK_OVERLAP, CHUNK_SIZE, MAX_CHUNKS, chunk_papers
+from embedding.query import create_chunks_batch_query, papers_without_chunks_page_query
+from ingestion.metrics import metrics
+from ingestion.paging import iter_pages
+from ingestion.query_registry import registry
+from ingestion.retry import RetryPolicy
+from ingestion.scheduler import WriteScheduler, pool_concurrency
+from ingestion.schema import prepare_schema
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+
+if not NEO4J_URI:
+    raise ValueError("Missing NEO4J_URI in environment")
+
+Page = Tuple[List[dict], List[dict]]
+
+registry.register("papers_without_chunks_page", papers_without_chunks_page_query)
+registry.register("chunks_batch", create_chunks_batch_query)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Split paper abstracts into Chunk nodes linked with HAS_CHUNK"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=500,
+        help="Papers read, chunked and written per transaction",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="Characters per chunk"
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=CHUNK_OVERLAP,
+        help="Characters shared by consecutive chunks",
+    )
+    parser.add_argument(
+        "--max-chunks",
+        type=int,
+        default=MAX_CHUNKS,
+        help="Chunks kept per abstract",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Processes used to chunk abstracts (0 chunks on the event loop)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=10,
+        help="Size of the Neo4j driver connection pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight page writes (defaults to --max-connections)",
+    )
+    parser.add_argument(
+        "--after",
+        type=str,
+        default="",
+        help="Only chunk papers whose paperId sorts after this one",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Attempts per page on transient errors such as deadlocks",
+    )
+    parser.add_argument(
+        "--no-create-schema",
+        action="store_true",
+        help="Only verify that the required constraints and indexes are online",
+    )
+    return parser.parse_args()
+
+
+async def create_chunks_batch_tx(tx, rows: List[dict]) -> None:
+    result = await tx.run(registry.get("chunks_batch"), rows=rows)
+    await result.consume()
+
+
+async def chunk_pages(
+    pages: AsyncGenerator[List[dict], None],
+    args: argparse.Namespace,
+    pool: Optional[Executor],
+) -> AsyncGenerator[Page, None]:
+    """Yield `(papers, chunk rows)` per page, in order. With a pool, up to
+    two pages per worker are chunked ahead of the writers."""
+    options = (args.chunk_size, args.chunk_overlap, args.max_chunks)
+    if pool is None:
+        async for papers in pages:
+            with metrics.time("chunk"):
+                rows = chunk_papers(papers, *options)
+            yield papers, rows
+        return
+
+    loop = asyncio.get_running_loop()
+    pending: Deque[Tuple[List[dict], asyncio.Future]] = deque()
+    async for papers in pages:
+        pending.append(
+            (papers, loop.run_in_executor(pool, chunk_papers, papers, *options))
+        )
+        if len(pending) >= args.workers * 2:
+            papers, future = pending.popleft()
+            yield papers, await future
+    while pending:
+        papers, future = pending.popleft()
+        yield papers, await future
+
+
+async def create_chunks(args: argparse.Namespace, pool: Optional[Executor]) -> None:
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+        max_connection_pool_size=args.max_connections,
+    ) as driver:
+        await prepare_schema(driver, NEO4J_DATABASE, create=not args.no_create_schema)
+        retry = RetryPolicy(attempts=args.retries)
+        papers_chunked = 0
+
+        async def write(page: Page) -> None:
+            nonlocal papers_chunked
+            papers, rows = page
+
+            async def write_page() -> None:
+                async with driver.session(database=NEO4J_DATABASE) as session:
+                    with metrics.time("transaction"):
+                        await session.write_transaction(create_chunks_batch_tx, rows)
+
+            # A page is one transaction, so a paper never ends up with only
+            # some of its chunks and being skipped on the next run.
+            try:
+                await retry.run(write_page)
+            except Exception as e:
+                metrics.error("write", e)
+                raise
+            papers_chunked += len(papers)
+            metrics.count("chunks_written", len(rows))
+            metrics.papers_written(len(papers))
+            print(
+                f"Chunked {len(papers)} papers into {len(rows)} chunks,",
+                f"up to paperId {papers[-1]['paperId']}",
+            )
+
+        concurrency = pool_concurrency(args.max_connections, args.concurrency)
+        start = time.perf_counter()
+        async with WriteScheduler(write, concurrency) as scheduler:
+            pages = iter_pages(
+                driver,
+                NEO4J_DATABASE,
+                "papers_without_chunks_page",
+                "paperId",
+                args.after,
+                args.page_size,
+            )
+            async for page in chunk_pages(pages, args, pool):
+                await scheduler.submit(page)
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            print(
+                f"Chunked {papers_chunked} papers at {papers_chunked / elapsed:.0f} papers/s"
+            )
+        if scheduler.failed:
+            print(f"{scheduler.failed} pages failed, run again to retry them")
+
+
+def main():
+    args = parse_args()
+    executor = ProcessPoolExecutor(args.workers) if args.workers else nullcontext()
+    with executor as pool:
+        asyncio.run(create_chunks(args, pool))
+
+
+if __name__ == "__main__":
+    main()
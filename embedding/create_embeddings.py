@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from neo4j import AsyncDriver, AsyncGraphDatabase
+
+from embedding.ann import MIN_TRAIN_SIZE, AnnIndex
+from embedding.backends import BACKENDS, EmbeddingBackend, create_backend
+from embedding.cache import EmbeddingCache, text_hash
+from embedding.query import (
+    CHUNK_VECTOR_INDEX,
+    chunks_without_embedding_page_query,
+    create_chunk_vector_index_query,
+    set_chunk_embeddings_batch_query,
+    vector_index_dimensions_query,
+)
+from ingestion.metrics import metrics
+from ingestion.paging import iter_pages
+from ingestion.query_registry import registry
+from ingestion.retry import RetryPolicy
+from ingestion.scheduler import WriteScheduler, pool_concurrency
+from ingestion.schema import SchemaError, prepare_schema
+from ingestion.utils import batched
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+
+if not NEO4J_URI:
+    raise ValueError("Missing NEO4J_URI in environment")
+
+registry.register("chunks_without_embedding_page", chunks_without_embedding_page_query)
+registry.register("chunk_embeddings_batch", set_chunk_embeddings_batch_query)
+registry.register("chunk_vector_index", create_chunk_vector_index_query)
+registry.register("vector_index_dimensions", vector_index_dimensions_query)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Embed the text of Chunk nodes and store it as textEmbedding"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="sentence-transformers",
+        help="Embedding backend; sentence-transformers and hashing run locally on the CPU",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Backend model name (the hashing backend takes its dimensions)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Texts sent to the model at a time",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=1000,
+        help="Chunks read and written per transaction",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="embedding-cache.db",
+        help="SQLite cache of vectors keyed on model and text hash",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=10,
+        help="Size of the Neo4j driver connection pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight page writes (defaults to --max-connections)",
+    )
+    parser.add_argument(
+        "--after",
+        type=str,
+        default="",
+        help="Only embed chunks whose chunkId sorts after this one",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Attempts per page on transient errors such as deadlocks",
+    )
+    parser.add_argument(
+        "--ann-index",
+        type=str,
+        default=None,
+        help="Local ANN index directory to add the written embeddings to",
+    )
+    parser.add_argument(
+        "--no-create-schema",
+        action="store_true",
+        help="Do not create the constraints or the vector index, only verify them",
+    )
+    return parser.parse_args()
+
+
+async def create_vector_index(driver: AsyncDriver, backend: EmbeddingBackend) -> None:
+    async with driver.session(database=NEO4J_DATABASE) as session:
+        result = await session.run(
+            registry.get("chunk_vector_index", dimensions=backend.dimensions)
+        )
+        await result.consume()
+
+
+async def verify_vector_index(driver: AsyncDriver, backend: EmbeddingBackend) -> None:
+    """Refuse to write vectors an existing index cannot hold. `IF NOT EXISTS`
+    keeps an index built for another model, e.g. the notebook's 1536-dim
+    OpenAI index, without any warning."""
+    async with driver.session(database=NEO4J_DATABASE) as session:
+        result = await session.run(
+            registry.get("vector_index_dimensions"), name=CHUNK_VECTOR_INDEX
+        )
+        record = await result.single()
+    if record is not None and record["dimensions"] != backend.dimensions:
+        raise SchemaError(
+            f"Vector index {CHUNK_VECTOR_INDEX} holds {record['dimensions']}-dimensional vectors, "
+            f"{backend.key} embeds into {backend.dimensions}"
+        )
+
+
+async def set_chunk_embeddings_batch_tx(tx, rows: List[dict]) -> None:
+    result = await tx.run(registry.get("chunk_embeddings_batch"), rows=rows)
+    await result.consume()
+
+
+async def embed_chunks(
+    chunks: List[dict], backend: EmbeddingBackend, cache: EmbeddingCache
+) -> List[dict]:
+    """Return `{chunkId, vector}` rows for a page of chunks. Only texts the
+    cache has not seen go to the model, `batch_size` at a time, on a thread
+    so the writers keep running."""
+    chunks = [chunk for chunk in chunks if chunk["text"]]
+    hashes = [text_hash(chunk["text"]) for chunk in chunks]
+    vectors = cache.get_many(backend.key, hashes)
+    texts = dict(zip(hashes, (chunk["text"] for chunk in chunks)))
+    missing = [digest for digest in texts if digest not in vectors]
+
+    loop = asyncio.get_running_loop()
+    for batch in batched(missing, backend.batch_size):
+        with metrics.time("embed"):
+            embedded = await loop.run_in_executor(
+                None, backend.embed, [texts[digest] for digest in batch]
+            )
+        cache.put_many(backend.key, zip(batch, embedded))
+        vectors.update(zip(batch, embedded))
+        metrics.count("texts_embedded", len(batch))
+
+    return [
+        {"chunkId": chunk["chunkId"], "vector": vectors[digest].tolist()}
+        for chunk, digest in zip(chunks, hashes)
+    ]
+
+
+async def create_embeddings(
+    args: argparse.Namespace,
+    backend: EmbeddingBackend,
+    cache: EmbeddingCache,
+    index: Optional[AnnIndex] = None,
+) -> None:
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+        max_connection_pool_size=args.max_connections,
+    ) as driver:
+        await prepare_schema(driver, NEO4J_DATABASE, create=not args.no_create_schema)
+        if not args.no_create_schema:
+            await create_vector_index(driver, backend)
+        await verify_vector_index(driver, backend)
+        retry = RetryPolicy(attempts=args.retries)
+        chunks_embedded = 0
+
+        async def write(rows: List[dict]) -> None:
+            nonlocal chunks_embedded
+
+            async def write_page() -> None:
+                async with driver.session(database=NEO4J_DATABASE) as session:
+                    with metrics.time("transaction"):
+                        await session.write_transaction(
+                            set_chunk_embeddings_batch_tx, rows
+                        )
+
+            try:
+                await retry.run(write_page)
+            except Exception as e:
+                metrics.error("write", e)
+                raise
+            chunks_embedded += len(rows)
+            metrics.count("chunks_embedded", len(rows))
+            if index is not None:
+                index.add(
+                    [row["chunkId"] for row in rows],
+                    np.array([row["vector"] for row in rows], dtype=np.float32),
+                )
+            print(f"Embedded {len(rows)} chunks, up to chunkId {rows[-1]['chunkId']}")
+
+        concurrency = pool_concurrency(args.max_connections, args.concurrency)
+        start = time.perf_counter()
+        async with WriteScheduler(write, concurrency) as scheduler:
+            pages = iter_pages(
+                driver,
+                NEO4J_DATABASE,
+                "chunks_without_embedding_page",
+                "chunkId",
+                args.after,
+                args.page_size,
+            )
+            async for chunks in pages:
+                rows = await embed_chunks(chunks, backend, cache)
+                if rows:
+                    await scheduler.submit(rows)
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            print(
+                f"Embedded {chunks_embedded} chunks at {chunks_embedded / elapsed:.0f} chunks/s"
+            )
+        print(f"Embedding cache: {cache.stats()}")
+        if (
+            index is not None
+            and index.centroids is None
+            and len(index) >= MIN_TRAIN_SIZE
+        ):
+            index.train()
+            print(f"Clustered the ANN index into {len(index.centroids)} lists")
+        if scheduler.failed:
+            print(f"{scheduler.failed} pages failed, run again to retry them")
+
+
+def main():
+    args = parse_args()
+    backend = create_backend(args.backend, args.model, args.batch_size)
+    cache = EmbeddingCache(args.cache)
+    index = None
+    if args.ann_index:
+        index = AnnIndex(args.ann_index, backend.dimensions)
+    try:
+        asyncio.run(create_embeddings(args, backend, cache, index))
+    finally:
+        cache.close()
+        if index is not None:
+            index.save()
+
+
+if __name__ == "__main__":
+    main()
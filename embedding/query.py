@@ -0,0 +1,116 @@
+def papers_without_chunks_page_query():
+    # Keyset pagination on the unique paperId index. Papers that already
+    # have chunks are skipped, which is what makes runs resumable.
+    return """
+    MATCH (paper:Paper)
+    WHERE paper.paperId > $after
+        AND paper.abstract IS NOT NULL
+        AND paper.abstract <> ''
+        AND NOT EXISTS { (paper)-[:HAS_CHUNK]->(:Chunk) }
+    RETURN paper.paperId AS paperId,
+        paper.title AS title,
+        paper.abstract AS abstract
+    ORDER BY paper.paperId
+    LIMIT $limit
+    """
+
+
+def create_chunks_batch_query():
+    return """
+    UNWIND $rows AS row
+    MATCH (paper:Paper {paperId: row.paperId})
+    MERGE (chunk:Chunk {chunkId: row.chunkId})
+        ON CREATE
+            SET chunk.paperId = row.paperId,
+                chunk.key = row.key,
+                chunk.chunkSeqId = row.chunkSeqId,
+                chunk.text = row.text,
+                chunk.title = row.title,
+                chunk.source = row.source
+    MERGE (paper)-[:HAS_CHUNK]->(chunk)
+    """
+
+
+def chunks_without_embedding_page_query():
+    return """
+    MATCH (chunk:Chunk)
+    WHERE chunk.chunkId > $after
+        AND chunk.textEmbedding IS NULL
+    RETURN chunk.chunkId AS chunkId, chunk.text AS text
+    ORDER BY chunk.chunkId
+    LIMIT $limit
+    """
+
+
+def set_chunk_embeddings_batch_query():
+    return """
+    UNWIND $rows AS row
+    MATCH (chunk:Chunk {chunkId: row.chunkId})
+    CALL db.create.setNodeVectorProperty(chunk, "textEmbedding", row.vector)
+    """
+
+
+CHUNK_VECTOR_INDEX = "abstract_chunks"
+
+
+def create_chunk_vector_index_query(dimensions: int):
+    return f"""
+    CREATE VECTOR INDEX {CHUNK_VECTOR_INDEX} IF NOT EXISTS
+    FOR (chunk:Chunk) ON (chunk.textEmbedding)
+    OPTIONS {{ indexConfig: {{
+        `vector.dimensions`: {int(dimensions)},
+        `vector.similarity_function`: 'cosine'
+    }}}}
+    """
+
+
+def vector_index_dimensions_query():
+    return """
+    SHOW INDEXES
+    YIELD name, options
+    WHERE name = $name
+    RETURN options.indexConfig['vector.dimensions'] AS dimensions
+    """
+
+
+def chunks_with_embedding_page_query():
+    # Only the ids: the vectors of chunks the local index already holds are
+    # never read back.
+    return """
+    MATCH (chunk:Chunk)
+    WHERE chunk.chunkId > $after
+        AND chunk.textEmbedding IS NOT NULL
+    RETURN chunk.chunkId AS chunkId
+    ORDER BY chunk.chunkId
+    LIMIT $limit
+    """
+
+
+def chunk_embeddings_query():
+    return """
+    UNWIND $ids AS id
+    MATCH (chunk:Chunk {chunkId: id})
+    WHERE chunk.textEmbedding IS NOT NULL
+    RETURN chunk.chunkId AS chunkId, chunk.textEmbedding AS vector
+    """
+
+
+def chunk_papers_query():
+    return """
+    UNWIND $ids AS id
+    MATCH (paper:Paper)-[:HAS_CHUNK]->(chunk:Chunk {chunkId: id})
+    RETURN chunk.chunkId AS chunkId,
+        chunk.text AS text,
+        paper.paperId AS paperId,
+        paper.title AS title
+    """
+
+
+def embedded_chunk_count_query():
+    # Chunks are created before they are embedded, and vector search only
+    # sees embedded ones.
+    return """
+    MATCH (chunk:Chunk)
+    WHERE chunk.textEmbedding IS NOT NULL
+    RETURN count(chunk) AS chunks
+    """
@@ -0,0 +1,271 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.query import embedded_chunk_count_query
+from ingestion.metrics import metrics
+
+
+def normalize_question(question: str) -> str:
+    "Case-folded, with runs of whitespace collapsed, as the exact-match key."
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+class ExactCache:
+    "LRU map with a per-entry time to live."
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable, now: float) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self.entries[key]
+            self.stats.expired += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, now: float) -> None:
+        self.entries[key] = (value, now + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class SemanticCache:
+    """Values keyed on unit-length embeddings. A lookup hits the most
+    similar live entry if its cosine similarity reaches `threshold`.
+
+    Embeddings sit in one preallocated matrix, so a lookup is a single
+    matrix-vector product. When full, an expired slot is reused first,
+    then the least recently used one."""
+
+    def __init__(
+        self, threshold: float = 0.95, max_size: int = 1024, ttl: float = 3600.0
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.vectors: Optional[np.ndarray] = None
+        self.values: List[Any] = [None] * max_size
+        self.expires = np.zeros(max_size)
+        self.used = np.zeros(max_size)
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return int((self.expires > 0).sum())
+
+    def get(self, vector: np.ndarray, now: float) -> Optional[Any]:
+        if self.vectors is None:
+            self.stats.misses += 1
+            return None
+        expired = (self.expires > 0) & (self.expires <= now)
+        if expired.any():
+            self.stats.expired += int(expired.sum())
+            self.expires[expired] = 0
+            for slot in np.flatnonzero(expired):
+                self.values[slot] = None
+        scores = np.where(self.expires > 0, self.vectors @ vector, -np.inf)
+        slot = int(np.argmax(scores))
+        if scores[slot] < self.threshold:
+            self.stats.misses += 1
+            return None
+        self.used[slot] = now
+        self.stats.hits += 1
+        return self.values[slot]
+
+    def put(self, vector: np.ndarray, value: Any, now: float) -> None:
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+        free = self.expires <= now
+        slot = int(np.argmax(free)) if free.any() else int(np.argmin(self.used))
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.expires[slot] = now + self.ttl
+        self.used[slot] = now
+
+    def clear(self) -> None:
+        self.expires[:] = 0
+        self.values = [None] * self.max_size
+
+
+def chunk_version(graph) -> Callable[[], int]:
+    """Version callable for `RetrievalCache` that changes whenever chunks
+    are embedded, i.e. become visible to vector search. `graph` is anything
+    with a `query(cypher)` method returning rows as dicts, such as
+    LangChain's `Neo4jGraph`. The count scans the Chunk label, so keep
+    `check_interval` at a few seconds or more."""
+    cypher = embedded_chunk_count_query()
+    return lambda: graph.query(cypher)[0]["chunks"]
+
+
+class RetrievalCache:
+    """Two-level cache in front of a retrieval pipeline.
+
+    An exact LRU keyed on the normalised question is tried first, then a
+    semantic cache keyed on the question's embedding, so near-identical
+    wordings reuse an answer. Both levels expire entries after `ttl`
+    seconds. If `version` is given it is polled at most every
+    `check_interval` seconds, and both levels are cleared when its value
+    changes, e.g. when new chunks are ingested (see `chunk_version`)."""
+
+    def __init__(
+        self,
+        embed: Callable[[str], np.ndarray],
+        version: Optional[Callable[[], Hashable]] = None,
+        max_size: int = 1024,
+        ttl: float = 3600.0,
+        threshold: float = 0.95,
+        check_interval: float = 5.0,
+        name: str = "retrieval",
+    ):
+        self.embed = embed
+        self.version = version
+        self.check_interval = check_interval
+        self.name = name
+        self.exact = ExactCache(max_size, ttl)
+        self.semantic = SemanticCache(threshold, max_size, ttl)
+        self.lock = threading.Lock()
+        self.invalidations = 0
+        self._version: Optional[Hashable] = None
+        self._checked = float("-inf")
+
+    def _clear(self) -> None:
+        "Clear both levels; the caller holds the lock."
+        self.exact.clear()
+        self.semantic.clear()
+        self.invalidations += 1
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self._clear()
+        metrics.count(f"{self.name}_cache_invalidations")
+
+    def _check_version(self, now: float) -> None:
+        if self.version is None or now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        version = self.version()
+        with self.lock:
+            changed = self._version is not None and version != self._version
+            if changed:
+                self._clear()
+            self._version = version
+        if changed:
+            metrics.count(f"{self.name}_cache_invalidations")
+
+    def _vector(self, key: str) -> np.ndarray:
+        vector = np.asarray(self.embed(key), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, question: str) -> Tuple[Optional[Any], str, Optional[np.ndarray]]:
+        """Return `(value, level, embedding)`. `level` is "exact",
+        "semantic" or "miss"; the embedding is None on an exact hit."""
+        now = time.monotonic()
+        self._check_version(now)
+        key = normalize_question(question)
+        with self.lock:
+            value = self.exact.get(key, now)
+        if value is not None:
+            metrics.count(f"{self.name}_cache_exact_hits")
+            return value, "exact", None
+        vector = self._vector(key)
+        with self.lock:
+            value = self.semantic.get(vector, now)
+            if value is not None:
+                self.exact.put(key, value, now)
+        if value is not None:
+            metrics.count(f"{self.name}_cache_semantic_hits")
+            return value, "semantic", vector
+        metrics.count(f"{self.name}_cache_misses")
+        return None, "miss", vector
+
+    def store(
+        self,
+        question: str,
+        value: Any,
+        vector: Optional[np.ndarray] = None,
+        invalidations: Optional[int] = None,
+    ) -> None:
+        """Cache `value`. With `invalidations`, the value is dropped if the
+        cache was cleared since that count was read, as it may be stale."""
+        key = normalize_question(question)
+        if vector is None:
+            vector = self._vector(key)
+        now = time.monotonic()
+        with self.lock:
+            if invalidations is not None and invalidations != self.invalidations:
+                return
+            self.exact.put(key, value, now)
+            self.semantic.put(vector, value, now)
+
+    def answer(self, question: str, compute: Callable[[str], Any]) -> Any:
+        "Return the cached value for `question`, or compute and cache it."
+        value, level, vector = self.lookup(question)
+        if level != "miss":
+            return value
+        invalidations = self.invalidations
+        with metrics.time(self.name):
+            value = compute(question)
+        # An answer computed across an invalidation may be stale already.
+        if value is not None:
+            self.store(question, value, vector, invalidations)
+        return value
+
+    def cached(self, compute: Callable[[str], Any]) -> Callable[[str], Any]:
+        "Wrap a question -> value function with this cache."
+        return lambda question: self.answer(question, compute)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            exact, semantic = self.exact.stats, self.semantic.stats
+            questions = exact.hits + exact.misses
+            return {
+                "exact": exact.as_dict(),
+                "semantic": semantic.as_dict(),
+                "hit_rate": round(
+                    (exact.hits + semantic.hits) / questions if questions else 0.0, 4
+                ),
+                "entries": len(self.exact),
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,574 @@
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import asdict
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from ingestion.metrics import metrics
+from ingestion.query_registry import registry
+from ingestion.reader import iter_records
+from ingestion.types import Paper, Venue
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+
+PIPELINES = ("sequential", "parallel")
+
+FIELDS_OF_STUDY = ["Materials Science", "Physics", "Chemistry", "Engineering"]
+PUBLICATION_TYPES = ["JournalArticle", "Conference", "Review"]
+OPEN_ACCESS_STATUSES = ["GOLD", "GREEN", "HYBRID", "BRONZE"]
+VENUE_TYPES = ["journal", "conference"]
+
+
+class ZipfSampler:
+    """Draws indexes in [0, population) with probability proportional to
+    1 / rank**exponent, so a few authors and venues account for most
+    papers as in the real corpus."""
+
+    def __init__(self, population: int, exponent: float, rng: random.Random):
+        self.population = range(population)
+        self.cum_weights = list(
+            accumulate(1 / rank**exponent for rank in range(1, population + 1))
+        )
+        self.rng = rng
+
+    def sample(self, k: int = 1) -> List[int]:
+        return self.rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+
+def synthetic_id(prefix: str, kind: str, index: int) -> str:
+    return hashlib.sha1(f"{prefix}:{kind}:{index}".encode("utf-8")).hexdigest()
+
+
+def synthetic_venue(prefix: str, index: int) -> dict:
+    venue_id = synthetic_id(prefix, "venue", index)
+    return {
+        "id": f"{venue_id[:8]}-{venue_id[8:12]}-{venue_id[12:16]}-{venue_id[16:20]}-{venue_id[20:32]}",
+        "name": f"Journal of Synthetic Studies {index}",
+        "type": VENUE_TYPES[index % len(VENUE_TYPES)],
+        "alternate_names": [f"J. Synth. Stud. {index}"],
+        "issn": f"{index % 10000:04d}-{index // 10000 % 10000:04d}",
+        "url": f"https://example.org/venues/{index}",
+    }
+
+
+def synthetic_record(
+    prefix: str,
+    index: int,
+    rng: random.Random,
+    authors: ZipfSampler,
+    venues: ZipfSampler,
+) -> dict:
+    "A record with the fields and nesting search_bulk/get_dataset.py writes."
+    paper_id = synthetic_id(prefix, "paper", index)
+    corpus_id = 200_000_000 + index
+    year = rng.randint(1990, 2024)
+    venue = synthetic_venue(prefix, venues.sample()[0]) if rng.random() < 0.8 else None
+    author_count = min(1 + int(rng.expovariate(1 / 4)), 50)
+    return {
+        "paperId": paper_id,
+        "externalIds": {
+            "MAG": str(3_000_000_000 + index) if rng.random() < 0.5 else None,
+            "DOI": f"10.{1000 + index % 9000}/synthetic.{index}",
+            "CorpusId": corpus_id,
+        },
+        "corpusId": corpus_id,
+        "publicationVenue": venue,
+        "url": f"https://www.semanticscholar.org/paper/{paper_id}",
+        "title": f"Synthetic study {index} of {rng.choice(FIELDS_OF_STUDY).lower()}",
+        "abstract": (
+            " ".join(["Lorem ipsum dolor sit amet."] * rng.randint(5, 40))
+            if rng.random() < 0.7
+            else None
+        ),
+        "venue": venue["name"] if venue else "",
+        "year": year,
+        "referenceCount": rng.randint(0, 120),
+        "citationCount": int(rng.paretovariate(1.2)) - 1,
+        "influentialCitationCount": rng.randint(0, 5),
+        "isOpenAccess": True,
+        "openAccessPdf": {
+            "url": f"https://example.org/pdf/{paper_id}.pdf",
+            "status": rng.choice(OPEN_ACCESS_STATUSES),
+        },
+        "fieldsOfStudy": [FIELDS_OF_STUDY[0]],
+        "s2FieldsOfStudy": [
+            {"category": FIELDS_OF_STUDY[0], "source": "external"},
+            {"category": rng.choice(FIELDS_OF_STUDY), "source": "s2-fos-model"},
+        ],
+        "publicationTypes": (
+            [rng.choice(PUBLICATION_TYPES)] if rng.random() < 0.9 else None
+        ),
+        "publicationDate": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "journal": {
+            "name": venue["name"] if venue else "",
+            "pages": f"{rng.randint(1, 500)}-{rng.randint(501, 999)}",
+            "volume": str(rng.randint(1, 80)),
+        },
+        "citationStyles": {"bibtex": f"@Article{{synthetic{index},\n}}"},
+        "authors": [
+            {
+                "authorId": str(10_000_000 + author),
+                "name": f"Author {synthetic_id(prefix, 'author', author)[:6]}",
+            }
+            for author in dict.fromkeys(authors.sample(author_count))
+        ],
+    }
+
+
+def generate_archives(
+    directory: str,
+    prefix: str,
+    papers: int,
+    files: int,
+    author_pool: int,
+    venue_pool: int,
+    exponent: float,
+    seed: int,
+) -> List[str]:
+    """Write `papers` synthetic records split over `files` JSONL archives.
+    `prefix` namespaces the ids so runs against one database never collide."""
+    rng = random.Random(seed)
+    authors = ZipfSampler(author_pool, exponent, rng)
+    venues = ZipfSampler(venue_pool, exponent, rng)
+    os.makedirs(directory, exist_ok=True)
+    paths: List[str] = []
+    per_file = -(-papers // files)
+    for number in range(files):
+        path = os.path.join(directory, f"{prefix}-{number:03d}.jsonl")
+        with open(path, "w", encoding="utf-8") as file:
+            for index in range(number * per_file, min(papers, (number + 1) * per_file)):
+                record = synthetic_record(prefix, index, rng, authors, venues)
+                file.write(json.dumps(record) + "\n")
+        paths.append(path)
+    return paths
+
+
+class FakeResult:
+    async def consume(self) -> None:
+        return None
+
+    async def single(self) -> None:
+        return None
+
+
+class FakeTransaction:
+    def __init__(self, driver: "FakeDriver"):
+        self.driver = driver
+
+    async def run(self, query: str, **params) -> FakeResult:
+        rows = len(params["rows"]) if "rows" in params else 1
+        self.driver.rows += rows
+        await asyncio.sleep(self.driver.latency + rows * self.driver.row_latency)
+        return FakeResult()
+
+
+class FakeSession:
+    def __init__(self, driver: "FakeDriver"):
+        self.driver = driver
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    async def write_transaction(self, transaction_function, *args, **kwargs):
+        async with self.driver.connections:
+            return await transaction_function(
+                FakeTransaction(self.driver), *args, **kwargs
+            )
+
+    def cancel(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+class FakeDriver:
+    """In-process stand-in for neo4j.AsyncDriver. A transaction holds one of
+    `max_connections` slots and sleeps for a round trip of `latency` seconds
+    plus `row_latency` per UNWIND row; nothing is stored."""
+
+    def __init__(self, latency: float, row_latency: float, max_connections: int):
+        self.latency = latency
+        self.row_latency = row_latency
+        self.connections = asyncio.Semaphore(max_connections)
+        self.rows = 0
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self)
+
+    async def close(self) -> None:
+        return None
+
+
+class TimedSession:
+    def __init__(self, session, latencies: List[float]):
+        self.session = session
+        self.latencies = latencies
+
+    async def __aenter__(self) -> "TimedSession":
+        await self.session.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self.session.__aexit__(exc_type, exc, tb)
+
+    async def write_transaction(self, transaction_function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.session.write_transaction(
+                transaction_function, *args, **kwargs
+            )
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+
+class TimedDriver:
+    "Wraps a real or fake driver and records the latency of every transaction."
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.latencies: List[float] = []
+
+    def session(self, **kwargs) -> TimedSession:
+        return TimedSession(self.driver.session(**kwargs), self.latencies)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.driver, name)
+
+
+def percentile(values: List[float], q: float) -> float:
+    "Nearest-rank percentile; 0.0 for an empty sample."
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+async def run_statement_tx(tx, query: str, params: dict) -> None:
+    result = await tx.run(query, **params)
+    await result.consume()
+
+
+async def run_sequential(driver, files: List[str]) -> int:
+    "One transaction per statement, in the order ingestion/main.py issues them."
+    papers = 0
+    async with driver.session(database=NEO4J_DATABASE) as session:
+        for file in files:
+            for record in iter_records(file):
+                paper = Paper(**record)
+                await session.write_transaction(
+                    run_statement_tx, registry.get("paper"), {"paper": paper.to_dict()}
+                )
+                if isinstance(paper.publicationVenue, dict):
+                    venue = Venue(**paper.publicationVenue)
+                    await session.write_transaction(
+                        run_statement_tx,
+                        registry.get("publication_venue"),
+                        {"venue": asdict(venue)},
+                    )
+                    await session.write_transaction(
+                        run_statement_tx,
+                        registry.get("publication_venue_relation_paper"),
+                        {"venueId": venue.id, "paperId": paper.paperId},
+                    )
+                for author in paper.authors:
+                    if author and author["authorId"] is not None:
+                        await session.write_transaction(
+                            run_statement_tx, registry.get("author"), {"author": author}
+                        )
+                        await session.write_transaction(
+                            run_statement_tx,
+                            registry.get("relation_paper_author"),
+                            {"paperId": paper.paperId, "authorId": author["authorId"]},
+                        )
+                papers += 1
+    return papers
+
+
+async def run_parallel(
+    driver, files: List[str], options: dict, pool: Optional[Executor], workdir: str
+) -> int:
+    "The main-parallel.py pipeline, fed by the benchmark's driver."
+    from ingestion.cache import NodeCache
+    from ingestion.checkpoint import CheckpointLedger
+
+    parallel = importlib.import_module("ingestion.main-parallel")
+    argv = [
+        workdir,
+        "--batch-size",
+        str(options["batch_size"]),
+        "--max-connections",
+        str(options["max_connections"]),
+        "--workers",
+        str(options["workers"]),
+        "--parallel-files",
+        str(options["parallel_files"]),
+        "--checkpoint",
+        os.path.join(workdir, "checkpoint.db"),
+    ]
+    if options["concurrency"]:
+        argv += ["--concurrency", str(options["concurrency"])]
+    args = parallel.parse_args(argv)
+    ledger = CheckpointLedger(args.checkpoint)
+    cache = NodeCache(args.cache_size)
+    try:
+        return await parallel.ingest_files(driver, files, args, pool, ledger, cache)
+    finally:
+        cache.close()
+        ledger.close()
+
+
+async def run_pipeline_async(
+    pipeline: str, files: List[str], options: dict, pool: Optional[Executor]
+) -> Dict[str, Any]:
+    if options["neo4j"]:
+        from neo4j import AsyncGraphDatabase
+
+        from ingestion.schema import prepare_schema
+
+        inner = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+            max_connection_pool_size=options["max_connections"],
+        )
+        await prepare_schema(inner, NEO4J_DATABASE)
+    else:
+        inner = FakeDriver(
+            options["latency"] / 1000,
+            options["row_latency"] / 1000,
+            options["max_connections"],
+        )
+    driver = TimedDriver(inner)
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        try:
+            if pipeline == "sequential":
+                papers = await run_sequential(driver, files)
+            else:
+                papers = await run_parallel(driver, files, options, pool, workdir)
+        finally:
+            await inner.close()
+        elapsed = time.perf_counter() - start
+    return {
+        "pipeline": pipeline,
+        "driver": "neo4j" if options["neo4j"] else "fake",
+        "papers": papers,
+        "elapsed_s": round(elapsed, 3),
+        "papers_per_s": round(papers / elapsed, 1) if elapsed > 0 else 0.0,
+        "transactions": len(driver.latencies),
+        "transactions_per_paper": (
+            round(len(driver.latencies) / papers, 3) if papers else 0.0
+        ),
+        "latency_p50_ms": round(percentile(driver.latencies, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(driver.latencies, 99) * 1000, 3),
+        "stages": metrics.snapshot()["stages"],
+    }
+
+
+def run_pipeline(pipeline: str, files: List[str], options: dict) -> Dict[str, Any]:
+    """Run one pipeline to completion. Called in a fresh process so that
+    peak RSS is that of this pipeline alone."""
+    if not options["neo4j"]:
+        # The pipeline modules refuse to import without a URI; the fake
+        # driver never connects to it.
+        os.environ.setdefault("NEO4J_URI", "bolt://localhost:7687")
+    executor = (
+        ProcessPoolExecutor(options["workers"])
+        if pipeline == "parallel" and options["workers"]
+        else nullcontext()
+    )
+    output = sys.stdout if options["verbose"] else open(os.devnull, "w")
+    with executor as pool, redirect_stdout(output):
+        result = asyncio.run(run_pipeline_async(pipeline, files, options, pool))
+    # ru_maxrss is in kilobytes on Linux.
+    result["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    result["peak_worker_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+    )
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sequential and parallel ingestion pipelines on synthetic archives"
+    )
+    parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        choices=PIPELINES,
+        default=list(PIPELINES),
+        help="Pipelines to run, in order",
+    )
+    parser.add_argument(
+        "--papers", type=int, default=5_000, help="Synthetic papers per pipeline"
+    )
+    parser.add_argument(
+        "--files", type=int, default=4, help="Archives the papers are split over"
+    )
+    parser.add_argument(
+        "--authors", type=int, default=50_000, help="Size of the author population"
+    )
+    parser.add_argument(
+        "--venues", type=int, default=1_000, help="Size of the venue population"
+    )
+    parser.add_argument(
+        "--zipf",
+        type=float,
+        default=1.1,
+        help="Zipf exponent of author and venue reuse (higher reuses more)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--archive-dir",
+        type=str,
+        default=None,
+        help="Keep the generated archives in this folder (defaults to a temporary one)",
+    )
+    parser.add_argument(
+        "--neo4j",
+        action="store_true",
+        help="Write to the Neo4j database configured in .env instead of the in-process fake driver",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=1.0,
+        help="Fake driver round trip per transaction, in milliseconds",
+    )
+    parser.add_argument(
+        "--row-latency",
+        type=float,
+        default=0.02,
+        help="Fake driver cost per UNWIND row, in milliseconds",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Papers per UNWIND transaction in the parallel pipeline",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=100,
+        help="Size of the (real or fake) connection pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight batch writes in the parallel pipeline",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Parse processes in the parallel pipeline",
+    )
+    parser.add_argument(
+        "--parallel-files",
+        type=int,
+        default=2,
+        help="Files ingested concurrently in the parallel pipeline",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the JSON results to this file instead of stdout",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Keep the pipelines' own progress output",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.neo4j and not NEO4J_URI:
+        raise ValueError("Missing NEO4J_URI in environment")
+    options = {
+        key: getattr(args, key)
+        for key in (
+            "neo4j",
+            "latency",
+            "row_latency",
+            "batch_size",
+            "max_connections",
+            "concurrency",
+            "workers",
+            "parallel_files",
+            "verbose",
+        )
+    }
+
+    results: List[Dict[str, Any]] = []
+    archive_dir = (
+        nullcontext(args.archive_dir)
+        if args.archive_dir
+        else tempfile.TemporaryDirectory()
+    )
+    with archive_dir as directory:
+        for pipeline in args.pipelines:
+            files = generate_archives(
+                directory,
+                pipeline,
+                args.papers,
+                args.files,
+                args.authors,
+                args.venues,
+                args.zipf,
+                args.seed,
+            )
+            print(f"Running {pipeline} on {args.papers} papers", file=sys.stderr)
+            with ProcessPoolExecutor(1) as executor:
+                result = executor.submit(
+                    run_pipeline, pipeline, files, options
+                ).result()
+            print(
+                f"{pipeline}: {result['papers_per_s']} papers/s,",
+                f"{result['transactions_per_paper']} transactions/paper,",
+                f"p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms,",
+                f"peak RSS {result['peak_rss_mb']} MB",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+    report = json.dumps({"config": vars(args), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import sqlite3
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Dict, Iterable, Optional
+
+
+def _digest(label: str, key: str) -> int:
+    digest = blake2b(f"{label}:{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class NodeCache:
+    """Keys of nodes already written by this run, shared across batches and
+    files so repeated venues and authors are not MERGEd again.
+
+    Keys are stored as 64-bit digests in a bounded LRU. With `path`, every
+    digest is also kept in a SQLite table that is consulted on LRU misses
+    and survives restarts; it must be deleted whenever the database is
+    wiped. Only add keys once the transaction that wrote them committed."""
+
+    def __init__(self, max_size: int = 500_000, path: Optional[str] = None):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS seen (digest INTEGER PRIMARY KEY)"
+            )
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+
+    def _remember(self, digest: int) -> None:
+        self.entries[digest] = None
+        self.entries.move_to_end(digest)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _contains(self, digest: int) -> bool:
+        if digest in self.entries:
+            self.entries.move_to_end(digest)
+            return True
+        if self.connection is None:
+            return False
+        row = self.connection.execute(
+            "SELECT 1 FROM seen WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            return False
+        self._remember(digest)
+        return True
+
+    def contains(self, label: str, key: str) -> bool:
+        found = self._contains(_digest(label, key))
+        counter = self.hits if found else self.misses
+        counter[label] = counter.get(label, 0) + 1
+        return found
+
+    def add_many(self, label: str, keys: Iterable[str]) -> None:
+        digests = [_digest(label, key) for key in keys]
+        for digest in digests:
+            self._remember(digest)
+        if self.connection is not None and digests:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO seen (digest) VALUES (?)",
+                    [(digest,) for digest in digests],
+                )
+
+    def hit_rate(self, label: Optional[str] = None) -> float:
+        labels = [label] if label else set(self.hits) | set(self.misses)
+        hits = sum(self.hits.get(name, 0) for name in labels)
+        total = hits + sum(self.misses.get(name, 0) for name in labels)
+        return hits / total if total else 0.0
+
+    def stats(self) -> str:
+        labels = sorted(set(self.hits) | set(self.misses))
+        return ", ".join(
+            f"{label} {self.hit_rate(label):.1%} hit rate "
+            f"({self.hits.get(label, 0)} skipped MERGEs)"
+            for label in labels
+        )
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+from typing import Set
+
+
+class CheckpointLedger:
+    """SQLite ledger of the batches committed for each archive.
+
+    Batches can complete out of order under the write scheduler, so the
+    ledger keeps every committed batch index rather than a single offset.
+    A file's entries are discarded when its size, mtime or the batch size
+    changes, since batch indices would no longer line up."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                batch_size INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS batches (
+                file TEXT NOT NULL,
+                batch INTEGER NOT NULL,
+                PRIMARY KEY (file, batch)
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _reset(self, file: str) -> None:
+        self.connection.execute("DELETE FROM files WHERE file = ?", (file,))
+        self.connection.execute("DELETE FROM batches WHERE file = ?", (file,))
+
+    def open_file(self, file: str, batch_size: int) -> Set[int]:
+        "Register a file and return the indices of its committed batches."
+        key = os.path.abspath(file)
+        stat = os.stat(file)
+        row = self.connection.execute(
+            "SELECT size, mtime, batch_size FROM files WHERE file = ?", (key,)
+        ).fetchone()
+        with self.connection:
+            if row != (stat.st_size, stat.st_mtime, batch_size):
+                self._reset(key)
+                self.connection.execute(
+                    "INSERT INTO files (file, size, mtime, batch_size) VALUES (?, ?, ?, ?)",
+                    (key, stat.st_size, stat.st_mtime, batch_size),
+                )
+        return {
+            batch
+            for (batch,) in self.connection.execute(
+                "SELECT batch FROM batches WHERE file = ?", (key,)
+            )
+        }
+
+    def is_done(self, file: str, batch_size: int) -> bool:
+        stat = os.stat(file)
+        row = self.connection.execute(
+            "SELECT size, mtime, batch_size, done FROM files WHERE file = ?",
+            (os.path.abspath(file),),
+        ).fetchone()
+        return row == (stat.st_size, stat.st_mtime, batch_size, 1)
+
+    def commit_batch(self, file: str, batch: int) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO batches (file, batch) VALUES (?, ?)",
+                (os.path.abspath(file), batch),
+            )
+
+    def finish_file(self, file: str) -> None:
+        key = os.path.abspath(file)
+        with self.connection:
+            self.connection.execute("UPDATE files SET done = 1 WHERE file = ?", (key,))
+            self.connection.execute("DELETE FROM batches WHERE file = ?", (key,))
+
+    def reset(self, file: str) -> None:
+        with self.connection:
+            self._reset(os.path.abspath(file))
@@ -0,0 +1,113 @@
+import dataclasses
+import types
+from typing import Any, Dict, Generator, Iterable, List, Optional, Union, get_args
+from typing import get_origin, get_type_hints
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingestion.types import Paper
+from ingestion.utils import batched
+
+_SCALARS = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}
+
+# Columns read back for ingestion; the remaining ones are never stored in
+# the graph (see create_paper_query).
+INGESTION_COLUMNS = [
+    "paperId",
+    "externalIds",
+    "corpusId",
+    "publicationVenue",
+    "url",
+    "title",
+    "abstract",
+    "venue",
+    "year",
+    "referenceCount",
+    "citationCount",
+    "influentialCitationCount",
+    "isOpenAccess",
+    "openAccessPdf",
+    "fieldsOfStudy",
+    "publicationTypes",
+    "publicationDate",
+    "authors",
+]
+
+
+def arrow_type(hint: Any) -> pa.DataType:
+    "Map a type annotation from ingestion/types.py to an Arrow type."
+    if hint in _SCALARS:
+        return _SCALARS[hint]
+    if dataclasses.is_dataclass(hint):
+        return pa.struct(
+            [
+                pa.field(name, arrow_type(field_hint))
+                for name, field_hint in get_type_hints(hint).items()
+            ]
+        )
+    origin = get_origin(hint)
+    if origin in (list, List):
+        return pa.list_(arrow_type(get_args(hint)[0]))
+    if origin in (Union, types.UnionType):
+        members = [arg for arg in get_args(hint) if arg is not type(None)]
+        # `Venue | str` is stored as the struct; see to_arrow_record.
+        structured = [arg for arg in members if dataclasses.is_dataclass(arg)]
+        return arrow_type(structured[0] if structured else members[0])
+    raise TypeError(f"No Arrow type for {hint!r}")
+
+
+def paper_schema() -> pa.Schema:
+    return pa.schema(
+        [
+            pa.field(name, arrow_type(hint))
+            for name, hint in get_type_hints(Paper).items()
+        ]
+    )
+
+
+def to_arrow_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    venue = record.get("publicationVenue")
+    if isinstance(venue, str):
+        record = {**record, "publicationVenue": {"id": None, "name": venue}}
+    return record
+
+
+def from_arrow_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    venue = record.get("publicationVenue")
+    if venue is not None and venue.get("id") is None:
+        record["publicationVenue"] = venue.get("name")
+    return record
+
+
+def write_parquet(
+    records: Iterable[Dict[str, Any]], path: str, row_group_size: int = 10_000
+) -> int:
+    "Write records as Parquet, one row group per `row_group_size` records."
+    schema = paper_schema()
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batched(records, row_group_size):
+            table = pa.Table.from_pylist(
+                [to_arrow_record(record) for record in batch], schema=schema
+            )
+            writer.write_table(table, row_group_size=row_group_size)
+            count += len(batch)
+    return count
+
+
+def iter_parquet_batches(
+    path: str, batch_size: int = 10_000, columns: Optional[List[str]] = None
+) -> Generator[pa.RecordBatch, None, None]:
+    "Yield record batches that only materialise the requested columns."
+    yield from pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size, columns=columns or INGESTION_COLUMNS
+    )
+
+
+def iter_parquet_records(
+    path: str, batch_size: int = 10_000
+) -> Generator[Dict[str, Any], None, None]:
+    for batch in iter_parquet_batches(path, batch_size):
+        for record in batch.to_pylist():
+            yield from_arrow_record(record)
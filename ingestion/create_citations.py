@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncGenerator, Deque, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from neo4j import AsyncGraphDatabase
+
+from ingestion.metrics import metrics
+from ingestion.paging import iter_pages
+from ingestion.query_registry import registry
+from ingestion.retry import RetryPolicy
+from ingestion.scheduler import WriteScheduler, pool_concurrency
+from ingestion.schema import prepare_schema
+from ingestion.utils import batched
+from search_bulk.rate_limit import TokenBucket
+from search_bulk.references import MAX_BATCH_IDS, ReferenceCache, ReferenceClient
+
+load_dotenv(".env", override=True)
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or "neo4j"
+S2_API_KEY = os.getenv("S2_API_KEY")
+
+if not NEO4J_URI:
+    raise ValueError("Missing NEO4J_URI in environment")
+
+Page = Tuple[List[str], Dict[str, List[str]]]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Fetch the references of the ingested papers and write CITES edges"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=MAX_BATCH_IDS,
+        help="Papers read, fetched and written per transaction",
+    )
+    parser.add_argument(
+        "--batch-ids",
+        type=int,
+        default=MAX_BATCH_IDS,
+        help=f"Paper ids per batch request (at most {MAX_BATCH_IDS})",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Batch requests in flight"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="Requests per second shared by all workers",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="references-cache.db",
+        help="SQLite cache of fetched references",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=10,
+        help="Size of the Neo4j driver connection pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight page writes (defaults to --max-connections)",
+    )
+    parser.add_argument(
+        "--after",
+        type=str,
+        default="",
+        help="Only fetch papers whose paperId sorts after this one",
+    )
+    parser.add_argument(
+        "--relink",
+        action="store_true",
+        help="Rewrite the edges of already fetched papers from the cache, e.g. after ingesting more papers",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Attempts per page on transient errors such as deadlocks",
+    )
+    parser.add_argument(
+        "--no-create-schema",
+        action="store_true",
+        help="Only verify that the required constraints and indexes are online",
+    )
+    args = parser.parse_args()
+    if not 1 <= args.batch_ids <= MAX_BATCH_IDS:
+        parser.error(f"--batch-ids must be between 1 and {MAX_BATCH_IDS}")
+    return args
+
+
+def fetch_references(
+    client: ReferenceClient,
+    cache: ReferenceCache,
+    paper_ids: List[str],
+    batch_ids: int,
+    fetch: bool = True,
+) -> Dict[str, List[str]]:
+    """References of `paper_ids`, from the cache when possible. Papers whose
+    request kept failing are left out, so the next run fetches them again.
+    With `fetch` off, papers missing from the cache are left out too."""
+    references = cache.get_many(paper_ids)
+    if not fetch:
+        return references
+    missing = [paper_id for paper_id in paper_ids if paper_id not in references]
+    for batch in batched(missing, batch_ids):
+        with metrics.time("fetch"):
+            fetched = client.fetch(batch)
+        if fetched is None:
+            metrics.count("papers_not_fetched", len(batch))
+            continue
+        cache.put_many(fetched)
+        references.update(fetched)
+        metrics.count("papers_fetched", len(fetched))
+    return references
+
+
+async def fetch_pages(
+    pages: AsyncGenerator[List[dict], None],
+    client: ReferenceClient,
+    cache: ReferenceCache,
+    args: argparse.Namespace,
+    pool: Executor,
+) -> AsyncGenerator[Page, None]:
+    """Yield `(paper ids, references)` per page, in order, with up to two
+    pages per worker fetched ahead of the writers."""
+    loop = asyncio.get_running_loop()
+    pending: Deque[Tuple[List[str], asyncio.Future]] = deque()
+    async for rows in pages:
+        paper_ids = [row["paperId"] for row in rows]
+        pending.append(
+            (
+                paper_ids,
+                loop.run_in_executor(
+                    pool,
+                    fetch_references,
+                    client,
+                    cache,
+                    paper_ids,
+                    args.batch_ids,
+                    not args.relink,
+                ),
+            )
+        )
+        if len(pending) >= args.workers * 2:
+            paper_ids, future = pending.popleft()
+            yield paper_ids, await future
+    while pending:
+        paper_ids, future = pending.popleft()
+        yield paper_ids, await future
+
+
+async def create_citations_batch_tx(tx, rows: List[dict]) -> int:
+    result = await tx.run(registry.get("citations_batch"), rows=rows)
+    record = await result.single()
+    return record["edges"] if record else 0
+
+
+async def create_citations(
+    args: argparse.Namespace,
+    client: ReferenceClient,
+    cache: ReferenceCache,
+    pool: Executor,
+) -> None:
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+        max_connection_pool_size=args.max_connections,
+    ) as driver:
+        await prepare_schema(driver, NEO4J_DATABASE, create=not args.no_create_schema)
+        retry = RetryPolicy(attempts=args.retries)
+        edges_written = 0
+
+        async def write(page: Page) -> None:
+            nonlocal edges_written
+            paper_ids, references = page
+            # Papers that were not fetched stay unmarked for the next run.
+            rows = [
+                {"paperId": paper_id, "citedIds": references[paper_id]}
+                for paper_id in paper_ids
+                if paper_id in references
+            ]
+            if not rows:
+                return
+            cited = sum(len(row["citedIds"]) for row in rows)
+
+            async def write_page() -> int:
+                async with driver.session(database=NEO4J_DATABASE) as session:
+                    with metrics.time("transaction"):
+                        return await session.write_transaction(
+                            create_citations_batch_tx, rows
+                        )
+
+            try:
+                edges = await retry.run(write_page)
+            except Exception as e:
+                metrics.error("write", e)
+                raise
+            edges_written += edges
+            metrics.count("citations_written", edges)
+            print(
+                f"Wrote {edges} CITES edges for {len(rows)} papers",
+                f"({cited - edges} references outside the graph),",
+                f"up to paperId {paper_ids[-1]}",
+            )
+
+        concurrency = pool_concurrency(args.max_connections, args.concurrency)
+        start = time.perf_counter()
+        async with WriteScheduler(write, concurrency) as scheduler:
+            pages = iter_pages(
+                driver,
+                NEO4J_DATABASE,
+                (
+                    "papers_with_references_page"
+                    if args.relink
+                    else "papers_without_references_page"
+                ),
+                "paperId",
+                args.after,
+                args.page_size,
+            )
+            async for page in fetch_pages(pages, client, cache, args, pool):
+                await scheduler.submit(page)
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            print(
+                f"Wrote {edges_written} CITES edges at {edges_written / elapsed:.0f} edges/s"
+            )
+        print(f"Reference cache: {cache.stats()}")
+        if scheduler.failed:
+            print(f"{scheduler.failed} pages failed, run again to retry them")
+
+
+def main():
+    args = parse_args()
+    client = ReferenceClient(
+        TokenBucket(rate=args.rate), args.workers, api_key=S2_API_KEY
+    )
+    cache = ReferenceCache(args.cache)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            asyncio.run(create_citations(args, client, cache, pool))
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 import os
+import time
+from dataclasses import asdict
+from typing import List, Optional
+
 from dotenv import load_dotenv
 from neo4j import AsyncDriver
 
-from ingestion.create_nodes_seq import (
-    create_publication_venue_relation_paper,
-)
-from ingestion.query import (
-    create_author_query,
-    create_paper_query,
-    create_publication_venue_query,
-)
+from ingestion.cache import NodeCache
+from ingestion.dead_letter import DeadLetterQueue
+from ingestion.metrics import metrics
+from ingestion.query_registry import registry
+from ingestion.retry import RetryPolicy, is_transient
+from ingestion.rows import BatchRows, build_batch_rows, rows_to_records, split_rows
 from ingestion.types import Author, Paper, Venue
 
 
@@ -26,19 +28,19 @@ if not NEO4J_URI:
 
 
 async def create_node_tx(tx, paper: Paper) -> None:
-    query = create_paper_query(paper)
+    query = registry.get("paper")
     result = await tx.run(query, paper=paper.to_dict())
     node = await result.single()
 
 
 async def create_author_node_tx(tx, author: Author) -> None:
-    query = create_author_query()
+    query = registry.get("author")
     result = await tx.run(query, author=author)
     node = await result.single()
 
 
 async def create_publication_venue_node_tx(tx, venue: Venue) -> None:
-    query = create_publication_venue_query(venue)
+    query = registry.get("publication_venue")
     result = await tx.run(query, venue=venue)
     node = await result.single()
 
@@ -46,16 +48,27 @@ async def create_publication_venue_node_tx(tx, venue: Venue) -> None:
 async def create_publication_venue_relation_paper_node_tx(
     tx, venue: Venue, paper: Paper
 ):
-    query = create_publication_venue_relation_paper(venue, paper)
-    result = await tx.run(query, venue=venue, paper=paper)
+    query = registry.get("publication_venue_relation_paper")
+    result = await tx.run(query, venueId=venue.id, paperId=paper.paperId)
     node = await result.single()
 
 
-async def create_paper_node(driver: AsyncDriver, paper: Paper):
+async def create_paper_node(
+    driver: AsyncDriver,
+    paper: Paper,
+    retry: RetryPolicy = RetryPolicy(),
+    dead_letters: Optional[DeadLetterQueue] = None,
+):
     async with driver.session(database=NEO4J_DATABASE) as session:
         authors = paper.authors
+
+        async def write(transaction_function, **kwargs) -> None:
+            await retry.run(
+                lambda: session.write_transaction(transaction_function, **kwargs)
+            )
+
         try:
-            await session.write_transaction(create_node_tx, paper)
+            await write(create_node_tx, paper=paper)
 
             if paper.publicationVenue is not None:
                 venue = (
@@ -67,11 +80,9 @@ async def create_paper_node(driver: AsyncDriver, paper: Paper):
                 if not isinstance(paper.publicationVenue, str) and isinstance(
                     venue, Venue
                 ):
-                    await session.write_transaction(
-                        create_publication_venue_node_tx, venue=venue
-                    )
+                    await write(create_publication_venue_node_tx, venue=venue)
 
-                    await session.write_transaction(
+                    await write(
                         create_publication_venue_relation_paper_node_tx,
                         venue=venue,
                         paper=paper,
@@ -79,11 +90,143 @@ async def create_paper_node(driver: AsyncDriver, paper: Paper):
 
             for author in authors:
                 if author and author["authorId"] is not None:
-                    await session.write_transaction(
-                        create_author_node_tx, author=author
-                    )
+                    await write(create_author_node_tx, author=author)
         except Exception as e:
             print(f"{paper.paperId}: {e}")
+            metrics.error("write", e)
+            if dead_letters is not None:
+                dead_letters.add([asdict(paper)], e)
             session.cancel()
         finally:
             await session.close()
+
+
+async def create_papers_batch_tx(tx, rows: List[dict], update: bool = False) -> None:
+    result = await tx.run(registry.get("papers_batch", update=update), rows=rows)
+    await result.consume()
+
+
+async def create_publication_venues_batch_tx(tx, rows: List[dict]) -> None:
+    result = await tx.run(registry.get("publication_venues_batch"), rows=rows)
+    await result.consume()
+
+
+async def create_publication_venue_relation_papers_batch_tx(
+    tx, rows: List[dict]
+) -> None:
+    result = await tx.run(
+        registry.get("publication_venue_relation_papers_batch"), rows=rows
+    )
+    await result.consume()
+
+
+async def create_authors_batch_tx(tx, rows: List[dict]) -> None:
+    result = await tx.run(registry.get("authors_batch"), rows=rows)
+    await result.consume()
+
+
+async def create_relation_paper_authors_batch_tx(tx, rows: List[dict]) -> None:
+    result = await tx.run(registry.get("relation_paper_authors_batch"), rows=rows)
+    await result.consume()
+
+
+async def write_batch_rows(
+    driver: AsyncDriver,
+    rows: BatchRows,
+    cache: Optional[NodeCache] = None,
+    update: bool = False,
+) -> float:
+    """Write a prepared batch with one UNWIND transaction per node and
+    relationship kind. Venues and authors found in `cache` are only used as
+    relationship endpoints. With `update`, existing papers get their
+    counters refreshed. Returns the elapsed time in seconds."""
+    venues, authors = rows.venues, rows.authors
+    if cache is not None:
+        venues = [row for row in venues if not cache.contains("Venue", row["id"])]
+        authors = [
+            row for row in authors if not cache.contains("Author", row["authorId"])
+        ]
+
+    start = time.perf_counter()
+    async with driver.session(database=NEO4J_DATABASE) as session:
+
+        async def write(transaction_function, items: List[dict], *args) -> None:
+            with metrics.time("transaction"):
+                await session.write_transaction(transaction_function, items, *args)
+
+        if rows.papers:
+            await write(create_papers_batch_tx, rows.papers, update)
+        if venues:
+            await write(create_publication_venues_batch_tx, venues)
+        if rows.venue_relations:
+            await write(
+                create_publication_venue_relation_papers_batch_tx,
+                rows.venue_relations,
+            )
+        if authors:
+            await write(create_authors_batch_tx, authors)
+        if rows.author_relations:
+            await write(create_relation_paper_authors_batch_tx, rows.author_relations)
+    elapsed = time.perf_counter() - start
+    metrics.observe("batch", elapsed)
+
+    if cache is not None:
+        cache.add_many("Venue", (row["id"] for row in venues))
+        cache.add_many("Author", (row["authorId"] for row in authors))
+    return elapsed
+
+
+async def write_rows_isolating(
+    driver: AsyncDriver,
+    rows: BatchRows,
+    cache: Optional[NodeCache] = None,
+    update: bool = False,
+    retry: RetryPolicy = RetryPolicy(),
+    dead_letters: Optional[DeadLetterQueue] = None,
+) -> int:
+    """Write a batch, retrying transient failures. Without `dead_letters`
+    the last error is raised. Otherwise a batch failing with a permanent
+    error is bisected until the failing papers are isolated, and those
+    papers, or a whole batch that is still failing transiently, are
+    dead-lettered. Returns the number of papers written."""
+    try:
+        await retry.run(lambda: write_batch_rows(driver, rows, cache, update))
+        return len(rows.papers)
+    except Exception as e:
+        if dead_letters is None:
+            raise
+        metrics.error("write", e)
+        if is_transient(e) or len(rows.papers) <= 1:
+            dead_letters.add(rows_to_records(rows), e)
+            metrics.count("papers_dead_lettered", len(rows.papers))
+            return 0
+    written = 0
+    for part in split_rows(rows, 2):
+        written += await write_rows_isolating(
+            driver, part, cache, update, retry, dead_letters
+        )
+    return written
+
+
+async def create_rows_batch(
+    driver: AsyncDriver,
+    rows: BatchRows,
+    cache: Optional[NodeCache] = None,
+    update: bool = False,
+    retry: RetryPolicy = RetryPolicy(),
+    dead_letters: Optional[DeadLetterQueue] = None,
+) -> int:
+    start = time.perf_counter()
+    written = await write_rows_isolating(
+        driver, rows, cache, update, retry, dead_letters
+    )
+    elapsed = time.perf_counter() - start
+    rate = written / elapsed if elapsed > 0 else 0.0
+    print(f"Wrote {written} papers in {elapsed:.2f}s ({rate:.0f} rows/s)")
+    return written
+
+
+async def create_papers_batch(
+    driver: AsyncDriver, papers: List[Paper], cache: Optional[NodeCache] = None
+) -> int:
+    return await create_rows_batch(driver, build_batch_rows(papers), cache)
@@ -2,16 +2,7 @@ from dataclasses import asdict
 from dotenv import load_dotenv
 import os
 
-from ingestion.query import (
-    create_author_query,
-    create_author_uniqueness_constraint_query,
-    create_paper_query,
-    create_paper_uniqueness_constraint_query,
-    create_publication_venue_query,
-    create_publication_venue_relation_paper_query,
-    create_publication_venue_uniqueness_constraint_query,
-    create_relation_paper_author_query,
-)
+from ingestion.query_registry import registry
 from ingestion.types import Author, Paper, Venue
 
 load_dotenv(".env", override=True)
@@ -31,47 +22,47 @@ kg = Neo4jGraph(
 
 
 def create_author(author: Author):
-    cypher = create_author_query()
+    cypher = registry.get("author")
     kg.query(cypher, params={"author": author})
     return cypher
 
 
 def create_author_uniqueness_constraint():
-    cypher = create_author_uniqueness_constraint_query()
+    cypher = registry.get("author_uniqueness_constraint")
     kg.query(cypher)
     return cypher
 
 
 def create_paper(paper: Paper):
-    cypher = create_paper_query(paper)
+    cypher = registry.get("paper")
     kg.query(cypher, params={"paper": paper.to_dict()})
     return cypher
 
 
 def create_paper_uniqueness_constraint():
-    cypher = create_paper_uniqueness_constraint_query()
+    cypher = registry.get("paper_uniqueness_constraint")
     kg.query(cypher)
     return cypher
 
 
 def create_relation_paper_author(paperId: str, authorId: str):
-    cypher = create_relation_paper_author_query(paperId, authorId)
+    cypher = registry.get("relation_paper_author")
     kg.query(cypher, params={"paperId": paperId, "authorId": authorId})
     return cypher
 
 
 def create_publication_venue(venue: Venue):
-    cypher = create_publication_venue_query(venue)
+    cypher = registry.get("publication_venue")
     kg.query(cypher, params={"venue": asdict(venue)})
 
 
 def create_publication_venue_uniqueness_constraint():
-    cypher = create_publication_venue_uniqueness_constraint_query()
+    cypher = registry.get("publication_venue_uniqueness_constraint")
     kg.query(cypher)
     return cypher
 
 
 def create_publication_venue_relation_paper(venue: Venue, paper: Paper):
-    cypher = create_publication_venue_relation_paper_query()
+    cypher = registry.get("publication_venue_relation_paper")
     kg.query(cypher, params={"venueId": venue.id, "paperId": paper.paperId})
     return cypher
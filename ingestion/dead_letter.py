@@ -0,0 +1,35 @@
+import json
+import os
+from typing import IO, List, Optional
+
+
+class DeadLetterQueue:
+    """Appends the records that could not be written to a JSONL archive.
+
+    The file has the same format as the fetched archives, so it can be
+    replayed with `python -m ingestion.replay`. Every append is synced so
+    that a crash does not lose failed records."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: Optional[IO[str]] = None
+        self.count = 0
+
+    def add(self, records: List[dict], error: BaseException) -> None:
+        if not records:
+            return
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        print(
+            f"Dead-lettered {len(records)} papers after {type(error).__name__}:", error
+        )
+        for record in records:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.count += len(records)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import os
+import shutil
+import zlib
+from typing import Any, Callable, Dict, List, Tuple
+
+from ingestion.reader import iter_records
+from ingestion.rows import BatchRows
+from ingestion.transform import transform_batch
+from ingestion.utils import batched, get_files
+
+ARRAY_DELIMITER = ";"
+
+Column = Tuple[str, Callable[[dict], Any]]
+
+
+def _nested(key: str, field: str) -> Callable[[dict], Any]:
+    return lambda row: (row.get(key) or {}).get(field)
+
+
+def _field(key: str) -> Callable[[dict], Any]:
+    return lambda row: row.get(key)
+
+
+# Same property mapping as create_paper_query / create_papers_batch_query.
+PAPER_COLUMNS: List[Column] = [
+    ("paperId:ID(Paper)", _field("paperId")),
+    ("title", _field("title")),
+    ("externalIdMag", _nested("externalIds", "MAG")),
+    ("externalIdDoi", _nested("externalIds", "DOI")),
+    ("externalIdCorpus:long", _nested("externalIds", "CorpusId")),
+    ("corpusId:long", _field("corpusId")),
+    ("publicationVenue", _field("publicationVenue")),
+    ("url", _field("url")),
+    ("venue", _field("venue")),
+    ("year:int", _field("year")),
+    ("referenceCount:int", _field("referenceCount")),
+    ("citationCount:int", _field("citationCount")),
+    ("abstract", _field("abstract")),
+    ("influentialCitationCount:int", _field("influentialCitationCount")),
+    ("isOpenAccess:boolean", _field("isOpenAccess")),
+    ("openAccessPdfUrl", _nested("openAccessPdf", "url")),
+    ("openAccessPdfStatus", _nested("openAccessPdf", "status")),
+    ("fieldsOfStudy:string[]", _field("fieldsOfStudy")),
+    ("publicationTypes:string[]", _field("publicationTypes")),
+    ("publicationDate", _field("publicationDate")),
+]
+
+VENUE_COLUMNS: List[Column] = [
+    ("venueId:ID(Venue)", _field("id")),
+    ("id", _field("id")),
+    ("name", _field("name")),
+    ("type", _field("type")),
+    ("alternate_names:string[]", _field("alternate_names")),
+    ("url", _field("url")),
+]
+
+AUTHOR_COLUMNS: List[Column] = [
+    ("authorId:ID(Author)", _field("authorId")),
+    ("name", _field("name")),
+]
+
+IS_AUTHOR_COLUMNS: List[Column] = [
+    (":START_ID(Author)", _field("authorId")),
+    (":END_ID(Paper)", _field("paperId")),
+    ("position:int", _field("position")),
+]
+
+WAS_PUBLISHED_COLUMNS: List[Column] = [
+    (":START_ID(Paper)", _field("paperId")),
+    (":END_ID(Venue)", _field("venueId")),
+]
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        return ARRAY_DELIMITER.join(
+            str(item).replace(ARRAY_DELIMITER, " ") for item in value
+        )
+    return str(value)
+
+
+class PartitionedCsv:
+    """CSV file deduplicated on its first `key_width` columns in bounded
+    memory. Rows are first hash-partitioned into spill files; each partition
+    is then deduplicated on its own, keeping the first row per key as
+    MERGE ... ON CREATE SET would."""
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        columns: List[Column],
+        key_width: int,
+        partitions: int,
+    ):
+        self.name = name
+        self.columns = columns
+        self.key_width = key_width
+        self.spill_directory = os.path.join(directory, f".{name}.partitions")
+        os.makedirs(self.spill_directory, exist_ok=True)
+        self.output = os.path.join(directory, f"{name}.csv")
+        self.files = [
+            open(
+                os.path.join(self.spill_directory, f"{index:04d}.csv"), "w", newline=""
+            )
+            for index in range(partitions)
+        ]
+        self.writers = [csv.writer(file) for file in self.files]
+
+    def add(self, row: dict) -> None:
+        values = [format_value(value(row)) for _, value in self.columns]
+        if not all(values[: self.key_width]):
+            return
+        key = "\x1f".join(values[: self.key_width])
+        partition = zlib.crc32(key.encode("utf-8")) % len(self.writers)
+        self.writers[partition].writerow(values)
+
+    def finish(self) -> int:
+        for file in self.files:
+            file.close()
+        count = 0
+        with open(self.output, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow([header for header, _ in self.columns])
+            for file in self.files:
+                seen = set()
+                with open(file.name, "r", newline="") as partition:
+                    for values in csv.reader(partition):
+                        key = tuple(values[: self.key_width])
+                        if key not in seen:
+                            seen.add(key)
+                            writer.writerow(values)
+                            count += 1
+        shutil.rmtree(self.spill_directory)
+        return count
+
+
+def export(
+    files: List[str], destination: str, batch_size: int, partitions: int
+) -> Dict[str, int]:
+    os.makedirs(destination, exist_ok=True)
+    outputs = {
+        "papers": PartitionedCsv(destination, "papers", PAPER_COLUMNS, 1, partitions),
+        "venues": PartitionedCsv(destination, "venues", VENUE_COLUMNS, 1, partitions),
+        "authors": PartitionedCsv(
+            destination, "authors", AUTHOR_COLUMNS, 1, partitions
+        ),
+        "is_author": PartitionedCsv(
+            destination, "is_author", IS_AUTHOR_COLUMNS, 2, partitions
+        ),
+        "was_published": PartitionedCsv(
+            destination, "was_published", WAS_PUBLISHED_COLUMNS, 2, partitions
+        ),
+    }
+    for file in files:
+        print("Exporting file ", file)
+        for batch in batched(iter_records(file), batch_size):
+            rows: BatchRows = transform_batch(batch)
+            for row in rows.papers:
+                outputs["papers"].add(row)
+            for row in rows.venues:
+                outputs["venues"].add(row)
+            for row in rows.authors:
+                outputs["authors"].add(row)
+            for row in rows.author_relations:
+                outputs["is_author"].add(row)
+            for row in rows.venue_relations:
+                outputs["was_published"].add(row)
+    return {name: output.finish() for name, output in outputs.items()}
+
+
+def import_command(destination: str, database: str) -> str:
+    path = os.path.abspath(destination)
+    return (
+        "neo4j-admin database import full"
+        f" --nodes=Paper={path}/papers.csv"
+        f" --nodes=Author={path}/authors.csv"
+        f" --nodes=Venue={path}/venues.csv"
+        f" --relationships=IS_AUTHOR={path}/is_author.csv"
+        f" --relationships=WAS_PUBLISHED={path}/was_published.csv"
+        f" --array-delimiter='{ARRAY_DELIMITER}' --multiline-fields=true {database}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export paper archives as neo4j-admin import CSV files"
+    )
+    parser.add_argument(
+        "path",
+        type=str,
+        help="The file name or directory of the json or jsonl file with the papers",
+    )
+    parser.add_argument("destination", type=str, help="Destination folder")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Number of records transformed at a time",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=64,
+        help="Spill partitions per file; raise it when a partition's keys do not fit in memory",
+    )
+    parser.add_argument(
+        "--database", type=str, default="neo4j", help="Target database name"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    counts = export(
+        get_files(args.path), args.destination, args.batch_size, args.partitions
+    )
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+    print("Import with:")
+    print(import_command(args.destination, args.database))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,28 @@ import argparse
 import asyncio
 import json
 import os
-from typing import List
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
-from neo4j import AsyncGraphDatabase
-
-from ingestion.create_nodes_parallel import create_paper_node
-from ingestion.create_nodes_seq import (
-    create_author_uniqueness_constraint,
-    create_paper_uniqueness_constraint,
-    create_publication_venue_uniqueness_constraint,
-)
-from ingestion.types import Paper
-from ingestion.utils import batched
+from neo4j import AsyncDriver, AsyncGraphDatabase
 
+from ingestion.cache import NodeCache
+from ingestion.checkpoint import CheckpointLedger
+from ingestion.create_nodes_parallel import create_rows_batch
+from ingestion.dead_letter import DeadLetterQueue
+from ingestion.metrics import log_metrics, metrics, serve_metrics
+from ingestion.query_registry import registry
+from ingestion.reader import iter_records
+from ingestion.retry import RetryPolicy
+from ingestion.rows import BatchRows
+from ingestion.schema import prepare_schema
+from ingestion.scheduler import WriteScheduler, pool_concurrency
+from ingestion.transform import transform_batches
+from ingestion.utils import batched, get_files
 
 load_dotenv(".env", override=True)
 NEO4J_URI = os.getenv("NEO4J_URI")
@@ -28,54 +36,301 @@ if not NEO4J_URI:
     exit(1)
 
 
-def parse_args():
+def parse_args(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description="Create paper on Neo4j dataset")
     parser.add_argument(
         "path",
         type=str,
-        help="The file name or directory of the json file with the papers",
+        help="The file name or directory of the json or jsonl file with the papers",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Number of papers written per UNWIND transaction",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=100,
+        help="Size of the Neo4j driver connection pool",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight batch writes (defaults to --max-connections)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=None,
+        help="Parsed batches buffered ahead of the writers (defaults to 2x concurrency)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Processes used to parse and flatten records (0 parses on the event loop)",
+    )
+    parser.add_argument(
+        "--parallel-files",
+        type=int,
+        default=2,
+        help="Number of files ingested concurrently over the shared driver",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default="ingestion-checkpoint.db",
+        help="SQLite ledger of committed batches used to resume interrupted runs",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore existing checkpoints and ingest every file from the start",
+    )
+    parser.add_argument(
+        "--no-create-schema",
+        action="store_true",
+        help="Only verify that the required constraints and indexes are online",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=500_000,
+        help="Authors and venues remembered in memory to skip repeated MERGEs",
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=str,
+        default=None,
+        help="SQLite file persisting the author/venue cache across runs "
+        "(delete it when the database is wiped)",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Refresh the citation and reference counters of papers that already exist",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Check record field types before writing and skip invalid records",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Attempts per batch on transient errors such as deadlocks",
+    )
+    parser.add_argument(
+        "--dead-letter",
+        type=str,
+        default="ingestion-dead-letter.jsonl",
+        help="JSONL archive collecting the papers that could not be written",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics at http://localhost:PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=None,
+        help="Print a JSON metrics line every METRICS_INTERVAL seconds",
     )
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
-async def create_nodes(data: List[dict]):  # type: ignore
-    async with AsyncGraphDatabase.driver(
-        NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
-    ) as driver:
-        counter = 0
-        batchSize = 24
-        length = len(data) // batchSize + 1
-        for batch in batched(data, batchSize):
-            counter += 1
-            coroutines = [create_paper_node(driver, Paper(**item)) for item in batch]
-            print("Processing batch ", counter, "/", length)
-            await asyncio.gather(*coroutines)
+@dataclass
+class FileProgress:
+    file: str
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    produced: bool = False
 
+    @property
+    def finished(self) -> bool:
+        return self.produced and self.completed + self.failed == self.submitted
 
-def get_files(path: str) -> List[str]:
-    files: List[str] = []
-    if os.path.isdir(path):
-        for file in os.listdir(path):
-            if file.endswith(".json"):
-                files.append(os.path.join(path, file))
-    elif os.path.isfile(path):
-        files.append(path)
-    return files
 
+def finish_file(progress: FileProgress, ledger: CheckpointLedger) -> None:
+    if progress.failed:
+        print(
+            f"Finished file {progress.file} with {progress.failed} failed batches,",
+            "run again to retry them",
+        )
+    else:
+        ledger.finish_file(progress.file)
+        print(f"Finished file {progress.file}")
 
-def main():
-    args = parse_args()
 
-    path = args.path
-    create_paper_uniqueness_constraint()
-    create_author_uniqueness_constraint()
-    create_publication_venue_uniqueness_constraint()
+async def create_nodes(
+    file: str,
+    args: argparse.Namespace,
+    pool: Optional[Executor],
+    scheduler: WriteScheduler,
+    ledger: CheckpointLedger,
+):  # type: ignore
+    committed = ledger.open_file(file, args.batch_size)
+    if committed:
+        print(f"Resuming {file}: skipping {len(committed)} committed batches")
+    progress = FileProgress(file)
+    # Records stay undecoded so that parsing is timed with the rest of the
+    # transform, wherever it runs.
+    records = iter_records(file, raw=True)
+    batches = (
+        (index, batch)
+        for index, batch in enumerate(batched(records, args.batch_size))
+        if index not in committed
+    )
+    async for index, rows in transform_batches(
+        batches, pool, args.workers * 2, args.validate
+    ):
+        progress.submitted += 1
+        metrics.observe_many(rows.timings)
+        metrics.skip(rows.skipped)
+        print(
+            "Processing batch ",
+            index + 1,
+            "of",
+            file,
+            f"(in flight {scheduler.in_flight}/{scheduler.concurrency},",
+            f"queued {scheduler.queue_depth})",
+        )
+        await scheduler.submit((progress, index, rows))
+        metrics.set_gauge("writes_in_flight", scheduler.in_flight)
+        metrics.set_gauge("batches_queued", scheduler.queue_depth)
+        await asyncio.sleep(0)
+    progress.produced = True
+    if progress.finished:
+        finish_file(progress, ledger)
+
+
+async def ingest_files(
+    driver: AsyncDriver,
+    files: List[str],
+    args: argparse.Namespace,
+    pool: Optional[Executor],
+    ledger: CheckpointLedger,
+    cache: NodeCache,
+) -> int:
+    "Write `files` through `driver` and return the number of papers written."
+    written = 0
+    retry = RetryPolicy(attempts=args.retries)
+    dead_letters = DeadLetterQueue(args.dead_letter)
 
+    async def write(item: Tuple[FileProgress, int, BatchRows]) -> None:
+        nonlocal written
+        progress, index, rows = item
+        try:
+            # Papers that keep failing are in the dead-letter file, so the
+            # batch is committed either way.
+            papers = await create_rows_batch(
+                driver, rows, cache, args.update, retry, dead_letters
+            )
+            ledger.commit_batch(progress.file, index)
+            progress.completed += 1
+            written += papers
+            metrics.count("batches_written")
+            metrics.papers_written(papers)
+        except Exception as e:
+            progress.failed += 1
+            metrics.count("batches_failed")
+            metrics.error("write", e)
+            raise
+        finally:
+            if progress.finished:
+                finish_file(progress, ledger)
+
+    concurrency = pool_concurrency(args.max_connections, args.concurrency)
+    file_slots = asyncio.Semaphore(args.parallel_files)
+    logger = (
+        asyncio.create_task(log_metrics(args.metrics_interval))
+        if args.metrics_interval
+        else None
+    )
+    start = time.perf_counter()
+    try:
+        async with WriteScheduler(write, concurrency, args.queue_size) as scheduler:
+
+            async def run(file: str) -> None:
+                async with file_slots:
+                    print("Processing file ", file)
+                    await create_nodes(file, args, pool, scheduler, ledger)
+
+            await asyncio.gather(*(run(file) for file in files))
+    finally:
+        if logger is not None:
+            logger.cancel()
+        dead_letters.close()
+    elapsed = time.perf_counter() - start
+    if elapsed > 0:
+        print(f"Wrote {written} papers at {written / elapsed:.0f} rows/s")
+    if scheduler.failed:
+        print(f"{scheduler.failed} batches failed")
+    if dead_letters.count:
+        print(
+            f"{dead_letters.count} papers written to {args.dead_letter},",
+            "replay them with python -m ingestion.replay",
+        )
+    print(f"Cache: {cache.stats()}")
+    print(f"Query templates: {registry.stats()}")
+    print(json.dumps({"metrics": metrics.snapshot()}))
+    return written
+
+
+async def create_files(
+    files: List[str],
+    args: argparse.Namespace,
+    pool: Optional[Executor],
+    ledger: CheckpointLedger,
+    cache: NodeCache,
+):  # type: ignore
+    async with AsyncGraphDatabase.driver(
+        NEO4J_URI,
+        auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+        max_connection_pool_size=args.max_connections,
+    ) as driver:
+        await prepare_schema(driver, NEO4J_DATABASE, create=not args.no_create_schema)
+        await ingest_files(driver, files, args, pool, ledger, cache)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    path = args.path
+    ledger = CheckpointLedger(args.checkpoint)
+    files: List[str] = []
     for file in get_files(path):
-        print("Processing file ", file)
-        with open(file, "r") as file:
-            data = json.load(file)
-        asyncio.run(create_nodes(data))
+        if args.restart:
+            ledger.reset(file)
+        if ledger.is_done(file, args.batch_size):
+            print(f"File {file} already ingested, skipping...")
+        else:
+            files.append(file)
+
+    if os.path.abspath(args.dead_letter) in map(os.path.abspath, files):
+        raise ValueError(
+            f"{args.dead_letter} is both an input and the dead-letter file,"
+            " use python -m ingestion.replay to replay it"
+        )
+
+    cache = NodeCache(args.cache_size, args.cache_path)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    executor = ProcessPoolExecutor(args.workers) if args.workers else nullcontext()
+    try:
+        with executor as pool:
+            asyncio.run(create_files(files, args, pool, ledger, cache))
+    finally:
+        cache.close()
+        ledger.close()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -36,8 +36,8 @@ def create_author(author: Author):
 
 def create_author_uniqueness_constraint():
     cypher = """
-    CREATE CONSTRAINT unique_author IF NOT EXISTS
-    FOR (a:Author) REQUIRE a.author IS UNIQUE
+    CREATE CONSTRAINT unique_author_id IF NOT EXISTS
+    FOR (a:Author) REQUIRE a.authorId IS UNIQUE
     """
     kg.query(cypher)
     return cypher
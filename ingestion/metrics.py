@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Generator, Mapping, Tuple
+
+
+@dataclass(slots=True)
+class StageTimer:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """Counters, per-stage timers and a rolling papers/s rate for one run.
+
+    Updated from the event loop and read from the metrics HTTP thread, so
+    every access goes through one lock."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.stages: Dict[str, StageTimer] = {}
+        self.counters: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.skipped: Counter = Counter()
+        self.gauges: Dict[str, float] = {}
+        self.written: Deque[Tuple[float, int]] = deque()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.stages.setdefault(stage, StageTimer()).observe(seconds)
+
+    def observe_many(self, timings: Mapping[str, float]) -> None:
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def error(self, stage: str, error: BaseException) -> None:
+        with self.lock:
+            self.errors[(stage, type(error).__name__)] += 1
+
+    def skip(self, reasons: Mapping[str, int]) -> None:
+        with self.lock:
+            self.skipped.update(reasons)
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    def papers_written(self, papers: int) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.counters["papers_written"] += papers
+            self.written.append((now, papers))
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        while self.written and self.written[0][0] < now - self.window:
+            self.written.popleft()
+
+    def rate(self) -> float:
+        "Papers per second over the last `window` seconds."
+        now = time.monotonic()
+        with self.lock:
+            self._trim(now)
+            papers = sum(count for _, count in self.written)
+            span = min(self.window, now - self.started)
+        return papers / span if span > 0 else 0.0
+
+    def snapshot(self) -> dict:
+        rate = self.rate()
+        with self.lock:
+            return {
+                "uptime_s": round(time.monotonic() - self.started, 1),
+                "papers_per_s": round(rate, 1),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "stages": {
+                    stage: {
+                        "count": timer.count,
+                        "total_s": round(timer.total, 3),
+                        "mean_ms": (
+                            round(timer.total / timer.count * 1000, 3)
+                            if timer.count
+                            else 0.0
+                        ),
+                        "max_ms": round(timer.max * 1000, 3),
+                    }
+                    for stage, timer in self.stages.items()
+                },
+                "errors": {
+                    f"{stage}:{error}": count
+                    for (stage, error), count in self.errors.items()
+                },
+                "skipped": dict(self.skipped),
+            }
+
+    def prometheus(self) -> str:
+        "Render the metrics in the Prometheus text exposition format."
+        rate = self.rate()
+        lines = [
+            "# TYPE ingestion_papers_per_second gauge",
+            f"ingestion_papers_per_second {rate}",
+        ]
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE ingestion_{name}_total counter")
+                lines.append(f"ingestion_{name}_total {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE ingestion_{name} gauge")
+                lines.append(f"ingestion_{name} {value}")
+            lines.append("# TYPE ingestion_stage_seconds summary")
+            for stage, timer in sorted(self.stages.items()):
+                lines.append(
+                    f'ingestion_stage_seconds_sum{{stage="{stage}"}} {timer.total}'
+                )
+                lines.append(
+                    f'ingestion_stage_seconds_count{{stage="{stage}"}} {timer.count}'
+                )
+            lines.append("# TYPE ingestion_stage_seconds_max gauge")
+            for stage, timer in sorted(self.stages.items()):
+                lines.append(
+                    f'ingestion_stage_seconds_max{{stage="{stage}"}} {timer.max}'
+                )
+            lines.append("# TYPE ingestion_errors_total counter")
+            for (stage, error), count in sorted(self.errors.items()):
+                lines.append(
+                    f'ingestion_errors_total{{stage="{stage}",type="{error}"}} {count}'
+                )
+            lines.append("# TYPE ingestion_records_skipped_total counter")
+            for reason, count in sorted(self.skipped.items()):
+                lines.append(
+                    f'ingestion_records_skipped_total{{reason="{reason}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def serve_metrics(port: int, host: str = "") -> ThreadingHTTPServer:
+    "Serve `metrics` at http://host:port/metrics from a daemon thread."
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def log_metrics(interval: float) -> None:
+    "Print a JSON snapshot of `metrics` every `interval` seconds until cancelled."
+    while True:
+        await asyncio.sleep(interval)
+        print(json.dumps({"metrics": metrics.snapshot()}), flush=True)
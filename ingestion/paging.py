@@ -0,0 +1,37 @@
+from typing import Any, AsyncGenerator, Dict, List
+
+from neo4j import AsyncDriver
+
+from ingestion.metrics import metrics
+from ingestion.query_registry import registry
+
+
+async def read_page_tx(
+    tx, query: str, after: str, limit: int, options: Dict[str, Any]
+) -> List[dict]:
+    result = await tx.run(registry.get(query, **options), after=after, limit=limit)
+    return await result.data()
+
+
+async def iter_pages(
+    driver: AsyncDriver,
+    database: str,
+    query: str,
+    key: str,
+    after: str = "",
+    page_size: int = 500,
+    **options,
+) -> AsyncGenerator[List[dict], None]:
+    """Yield the pages of a keyset-paginated registry query, which takes
+    `$after` and `$limit` and returns rows ordered by `key`. `options`
+    select the template variant."""
+    while True:
+        async with driver.session(database=database) as session:
+            with metrics.time("read"):
+                rows = await session.read_transaction(
+                    read_page_tx, query, after, page_size, options
+                )
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][key]
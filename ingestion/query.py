@@ -1,8 +1,8 @@
-from ingestion.types import Paper, Venue
-
-
-def create_paper_query(paper: Paper):
-    cypher = """
+def create_paper_query():
+    # One template for every paper: string venues are passed as
+    # `publicationVenue` and structured ones as null (see Paper.to_dict), so
+    # the server plans it once.
+    return """
     MERGE (paper:Paper {paperId: $paper.paperId})
         ON CREATE
             SET paper.title = $paper.title,
@@ -10,11 +10,7 @@ def create_paper_query(paper: Paper):
                 paper.externalIdDoi = $paper.externalIds.DOI,
                 paper.externalIdCorpus = $paper.externalIds.CorpusId,
                 paper.corpusId = $paper.corpusId,
-                """
-    if isinstance(paper.publicationVenue, str):
-        cypher += "paper.publicationVenue = $paper.publicationVenue"
-
-    cypher += """
+                paper.publicationVenue = $paper.publicationVenue,
                 paper.url = $paper.url,
                 paper.venue = $paper.venue,
                 paper.year = $paper.year,
@@ -32,10 +28,8 @@ def create_paper_query(paper: Paper):
         RETURN paper.paperId as id
     """
 
-    return cypher
-
 
-def create_publication_venue_query(venue: Venue):
+def create_publication_venue_query():
     return """
     MERGE (venue:Venue {venueId: $venue.id})
         ON CREATE
@@ -47,7 +41,7 @@ def create_publication_venue_query(venue: Venue):
     """
 
 
-def create_relation_paper_author_query(paperId: str, authorId: str):
+def create_relation_paper_author_query():
     return """
     MATCH (paper:Paper {paperId: $paperId})
     MATCH (author:Author {authorId: $authorId})
@@ -66,8 +60,8 @@ def create_author_query():
 
 def create_author_uniqueness_constraint_query():
     return """
-    CREATE CONSTRAINT unique_author IF NOT EXISTS
-    FOR (a:Author) REQUIRE a.author IS UNIQUE
+    CREATE CONSTRAINT unique_author_id IF NOT EXISTS
+    FOR (a:Author) REQUIRE a.authorId IS UNIQUE
     """
 
 
@@ -91,3 +85,121 @@ def create_publication_venue_relation_paper_query():
     MATCH (paper:Paper {paperId: $paperId})
     MERGE (paper)-[:WAS_PUBLISHED]->(venue)
     """
+
+
+def create_papers_batch_query(update: bool = False):
+    cypher = """
+    UNWIND $rows AS row
+    MERGE (paper:Paper {paperId: row.paperId})
+        ON CREATE
+            SET paper.title = row.title,
+                paper.externalIdMag = row.externalIds.MAG,
+                paper.externalIdDoi = row.externalIds.DOI,
+                paper.externalIdCorpus = row.externalIds.CorpusId,
+                paper.corpusId = row.corpusId,
+                paper.publicationVenue = row.publicationVenue,
+                paper.url = row.url,
+                paper.venue = row.venue,
+                paper.year = row.year,
+                paper.referenceCount = row.referenceCount,
+                paper.citationCount = row.citationCount,
+                paper.abstract = row.abstract,
+                paper.influentialCitationCount = row.influentialCitationCount,
+                paper.isOpenAccess = row.isOpenAccess,
+                paper.openAccessPdfUrl = row.openAccessPdf.url,
+                paper.openAccessPdfStatus = row.openAccessPdf.status,
+                paper.fieldsOfStudy = row.fieldsOfStudy,
+                paper.publicationTypes = row.publicationTypes,
+                paper.publicationDate = row.publicationDate
+    """
+    if update:
+        # Incremental runs refresh the counters that change between fetches.
+        cypher += """
+        ON MATCH
+            SET paper.referenceCount = row.referenceCount,
+                paper.citationCount = row.citationCount,
+                paper.influentialCitationCount = row.influentialCitationCount
+    """
+
+    return cypher
+
+
+def create_publication_venues_batch_query():
+    return """
+    UNWIND $rows AS row
+    MERGE (venue:Venue {venueId: row.id})
+        ON CREATE
+            SET venue.id = row.id,
+                venue.name = row.name,
+                venue.type = row.type,
+                venue.alternate_names = row.alternate_names,
+                venue.url = row.url
+    """
+
+
+def create_publication_venue_relation_papers_batch_query():
+    return """
+    UNWIND $rows AS row
+    MATCH (venue:Venue {venueId: row.venueId})
+    MATCH (paper:Paper {paperId: row.paperId})
+    MERGE (paper)-[:WAS_PUBLISHED]->(venue)
+    """
+
+
+def create_authors_batch_query():
+    return """
+    UNWIND $rows AS row
+    MERGE (author:Author {authorId: row.authorId})
+        ON CREATE
+            SET author.name = row.name,
+                author.authorId = row.authorId
+    """
+
+
+def create_relation_paper_authors_batch_query():
+    return """
+    UNWIND $rows AS row
+    MATCH (paper:Paper {paperId: row.paperId})
+    MATCH (author:Author {authorId: row.authorId})
+    MERGE (author)-[relation:IS_AUTHOR]->(paper)
+        SET relation.position = row.position
+    """
+
+
+def papers_without_references_page_query():
+    # Papers known to reference nothing are never sent to the API.
+    return """
+    MATCH (paper:Paper)
+    WHERE paper.paperId > $after
+        AND coalesce(paper.referenceCount, 1) > 0
+        AND paper.referencesFetchedAt IS NULL
+    RETURN paper.paperId AS paperId
+    ORDER BY paper.paperId
+    LIMIT $limit
+    """
+
+
+def papers_with_references_page_query():
+    return """
+    MATCH (paper:Paper)
+    WHERE paper.paperId > $after AND paper.referencesFetchedAt IS NOT NULL
+    RETURN paper.paperId AS paperId
+    ORDER BY paper.paperId
+    LIMIT $limit
+    """
+
+
+def create_citations_batch_query():
+    # Every paper is marked as fetched, even if none of its references is in
+    # the graph. References to papers outside the graph find no match and
+    # are dropped.
+    return """
+    UNWIND $rows AS row
+    MATCH (paper:Paper {paperId: row.paperId})
+    SET paper.referencesFetchedAt = timestamp()
+    WITH paper, row
+    UNWIND row.citedIds AS citedId
+    MATCH (cited:Paper {paperId: citedId})
+    MERGE (paper)-[:CITES]->(cited)
+    RETURN count(*) AS edges
+    """
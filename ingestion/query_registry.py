@@ -0,0 +1,76 @@
+from collections import Counter
+from typing import Callable, Dict, Tuple
+
+from ingestion import query
+
+Variant = Tuple[str, Tuple[Tuple[str, object], ...]]
+
+
+class QueryRegistry:
+    """Cypher templates built once per variant and shared by every writer.
+
+    Templates only differ by their keyword options (e.g. `update` for the
+    paper batch), never by row data, so each variant is one cached plan on
+    the server. `usage` counts how often each variant was handed out."""
+
+    def __init__(self):
+        self.builders: Dict[str, Callable[..., str]] = {}
+        self.templates: Dict[Variant, str] = {}
+        self.usage: Counter = Counter()
+
+    def register(self, name: str, builder: Callable[..., str]) -> None:
+        self.builders[name] = builder
+
+    def get(self, name: str, **options) -> str:
+        variant = (name, tuple(sorted(options.items())))
+        template = self.templates.get(variant)
+        if template is None:
+            template = self.templates[variant] = self.builders[name](**options)
+        self.usage[variant] += 1
+        return template
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            name + "".join(f" {key}={value}" for key, value in options): count
+            for (name, options), count in self.usage.most_common()
+        }
+
+
+registry = QueryRegistry()
+registry.register("paper", query.create_paper_query)
+registry.register("author", query.create_author_query)
+registry.register("publication_venue", query.create_publication_venue_query)
+registry.register("relation_paper_author", query.create_relation_paper_author_query)
+registry.register(
+    "publication_venue_relation_paper",
+    query.create_publication_venue_relation_paper_query,
+)
+registry.register(
+    "author_uniqueness_constraint", query.create_author_uniqueness_constraint_query
+)
+registry.register(
+    "paper_uniqueness_constraint", query.create_paper_uniqueness_constraint_query
+)
+registry.register(
+    "publication_venue_uniqueness_constraint",
+    query.create_publication_venue_uniqueness_constraint_query,
+)
+registry.register("papers_batch", query.create_papers_batch_query)
+registry.register(
+    "publication_venues_batch", query.create_publication_venues_batch_query
+)
+registry.register(
+    "publication_venue_relation_papers_batch",
+    query.create_publication_venue_relation_papers_batch_query,
+)
+registry.register("authors_batch", query.create_authors_batch_query)
+registry.register(
+    "relation_paper_authors_batch", query.create_relation_paper_authors_batch_query
+)
+registry.register(
+    "papers_without_references_page", query.papers_without_references_page_query
+)
+registry.register(
+    "papers_with_references_page", query.papers_with_references_page_query
+)
+registry.register("citations_batch", query.create_citations_batch_query)
@@ -0,0 +1,140 @@
+import gzip
+import io
+import json
+from typing import IO, Any, Generator
+
+CHUNK_SIZE = 1 << 16
+
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+
+
+def strip_compression(path: str) -> str:
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+
+def open_archive(path: str) -> IO[str]:
+    "Open a plain, gzip or zstd compressed archive as text."
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst archives requires the zstandard package")
+        file = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            file, read_across_frames=True, closefd=True
+        )
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_jsonl(file: IO[str], raw: bool = False) -> Generator[Any, None, None]:
+    for line in file:
+        line = line.strip()
+        if line:
+            yield line if raw else json.loads(line)
+
+
+def iter_json_array(
+    file: IO[str], chunk_size: int = CHUNK_SIZE
+) -> Generator[Any, None, None]:
+    "Yield the items of a top-level JSON array without loading the whole file."
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip(chars: str) -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    def close() -> None:
+        "Consume the closing bracket; only whitespace may follow it."
+        nonlocal pos
+        pos += 1
+        skip(" \t\r\n")
+        if pos < len(buffer):
+            raise ValueError(
+                f"unexpected data after the JSON array: {buffer[pos : pos + 20]!r}"
+            )
+
+    skip(" \t\r\n")
+    if pos >= len(buffer) or buffer[pos] != "[":
+        raise ValueError("expected a top-level JSON array")
+    pos += 1
+    skip(" \t\r\n")
+    if pos < len(buffer) and buffer[pos] == "]":
+        close()
+        return
+
+    while True:
+        if pos >= len(buffer):
+            raise ValueError("unterminated JSON array")
+        if buffer[pos] in ",]":
+            raise ValueError(f"expected a JSON value at {buffer[pos : pos + 20]!r}")
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not fill():
+                raise
+            continue
+        # A value ending at the buffer boundary may be truncated, and so may
+        # a number that is not followed by a delimiter (e.g. "-1" of
+        # "-1.5e10"), so only accept those once more input is available.
+        if not eof and (
+            end == len(buffer)
+            or (
+                isinstance(item, (int, float))
+                and not isinstance(item, bool)
+                and buffer[end] not in " \t\r\n,]"
+            )
+        ):
+            if fill():
+                continue
+        pos = end
+        yield item
+        skip(" \t\r\n")
+        if pos >= len(buffer):
+            raise ValueError("unterminated JSON array")
+        if buffer[pos] == "]":
+            close()
+            return
+        if buffer[pos] != ",":
+            raise ValueError(f"expected ',' or ']' at {buffer[pos : pos + 20]!r}")
+        pos += 1
+        skip(" \t\r\n")
+
+
+def iter_records(path: str, raw: bool = False) -> Generator[Any, None, None]:
+    """Stream the paper records of a .json or .jsonl archive, optionally
+    gzip or zstd compressed, one at a time. With `raw`, JSONL records are
+    yielded as undecoded lines so parsing can happen elsewhere. Parquet
+    archives are read column-projected through ingestion.columnar."""
+    if path.endswith(".parquet"):
+        from ingestion.columnar import iter_parquet_records
+
+        yield from iter_parquet_records(path)
+        return
+    with open_archive(path) as file:
+        if strip_compression(path).endswith(".jsonl"):
+            yield from iter_jsonl(file, raw)
+        else:
+            yield from iter_json_array(file)
@@ -0,0 +1,45 @@
+import argparse
+import importlib
+import os
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay the papers of a dead-letter file through main-parallel.py",
+        epilog="Any other option is passed on to main-parallel.py.",
+    )
+    parser.add_argument(
+        "dead_letter",
+        type=str,
+        nargs="?",
+        default="ingestion-dead-letter.jsonl",
+        help="Dead-letter file written by main-parallel.py",
+    )
+    return parser.parse_known_args()
+
+
+def main():
+    args, options = parse_args()
+    if not os.path.exists(args.dead_letter):
+        print(f"No dead-letter file at {args.dead_letter}, nothing to replay")
+        return
+
+    # Papers failing again are appended to a fresh file at the original
+    # path, so the replayed batch is moved aside first.
+    root, extension = os.path.splitext(args.dead_letter)
+    replay = f"{root}.{time.strftime('%Y%m%dT%H%M%S')}{extension}"
+    os.replace(args.dead_letter, replay)
+    print(f"Replaying {replay}")
+
+    parallel = importlib.import_module("ingestion.main-parallel")
+    parallel.main([replay, "--dead-letter", args.dead_letter, *options])
+    if os.path.exists(args.dead_letter):
+        print(f"Some papers failed again, see {args.dead_letter}")
+    else:
+        os.remove(replay)
+        print("All dead-lettered papers were written")
+
+
+if __name__ == "__main__":
+    main()
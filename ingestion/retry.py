@@ -0,0 +1,45 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from ingestion.metrics import metrics
+
+T = TypeVar("T")
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errors worth retrying: deadlocks, leader switches, lost connections
+    and other failures the driver marks as retryable."""
+    is_retryable = getattr(error, "is_retryable", None)
+    if callable(is_retryable) and is_retryable():
+        return True
+    return isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+
+@dataclass(frozen=True, slots=True)
+class RetryPolicy:
+    """Retries transient failures of a whole operation with full-jitter
+    exponential backoff, on top of the driver's own transaction retries."""
+
+    attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def run(self, operation: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await operation()
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.attempts or not is_transient(e):
+                    raise
+                metrics.count("retries")
+                metrics.error("retry", e)
+                delay = self.delay(attempt)
+                print(f"Transient error ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
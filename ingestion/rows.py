@@ -0,0 +1,230 @@
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from ingestion.types import Paper, Venue
+
+# Keys of a paper row, i.e. everything create_paper_query stores.
+PAPER_ROW_KEYS = (
+    "paperId",
+    "title",
+    "externalIds",
+    "corpusId",
+    "publicationVenue",
+    "url",
+    "venue",
+    "year",
+    "referenceCount",
+    "citationCount",
+    "abstract",
+    "influentialCitationCount",
+    "isOpenAccess",
+    "openAccessPdf",
+    "fieldsOfStudy",
+    "publicationTypes",
+    "publicationDate",
+)
+
+_COUNTERS = ("corpusId", "year", "referenceCount", "citationCount")
+
+
+@dataclass(slots=True)
+class BatchRows:
+    papers: List[dict] = field(default_factory=list)
+    venues: List[dict] = field(default_factory=list)
+    venue_relations: List[dict] = field(default_factory=list)
+    authors: List[dict] = field(default_factory=list)
+    author_relations: List[dict] = field(default_factory=list)
+    # Filled in by transform_batch, possibly in a worker process, and
+    # reported by the consumer: seconds per stage and skipped records by
+    # reason.
+    timings: Dict[str, float] = field(default_factory=dict)
+    skipped: Dict[str, int] = field(default_factory=dict)
+
+
+def _as_dict(value: Any) -> Any:
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    return value
+
+
+def paper_row(paper: Paper) -> dict:
+    row = paper.to_dict()
+    row["externalIds"] = _as_dict(row["externalIds"])
+    row["openAccessPdf"] = _as_dict(row["openAccessPdf"])
+    return row
+
+
+def record_row(record: Dict[str, Any]) -> dict:
+    "Flatten a raw archive record straight into a paper row."
+    row = {key: record.get(key) for key in PAPER_ROW_KEYS}
+    if not isinstance(row["publicationVenue"], str):
+        row["publicationVenue"] = None
+    return row
+
+
+def validate_record(record: Dict[str, Any]) -> None:
+    "Cheap structural checks; raises ValueError for records the writers reject."
+    if not isinstance(record["paperId"], str):
+        raise ValueError(f"{record['paperId']}: paperId is not a string")
+    for key in _COUNTERS:
+        value = record.get(key)
+        if value is not None and not isinstance(value, int):
+            raise ValueError(f"{record['paperId']}: {key} is not an integer")
+    if not isinstance(record.get("authors") or [], list):
+        raise ValueError(f"{record['paperId']}: authors is not a list")
+
+
+def venue_row(venue: Venue | Dict[str, Any]) -> dict:
+    venue = _as_dict(venue)
+    return {
+        "id": venue.get("id"),
+        "name": venue.get("name"),
+        "type": venue.get("type"),
+        "alternate_names": venue.get("alternate_names"),
+        "url": venue.get("url"),
+    }
+
+
+class _BatchBuilder:
+    # Venues and authors are keyed like their MERGE so that a batch never
+    # sends the same node twice.
+    __slots__ = ("rows", "venues", "authors")
+
+    def __init__(self):
+        self.rows = BatchRows()
+        self.venues: Dict[str, dict] = {}
+        self.authors: Dict[str, dict] = {}
+
+    def add(
+        self, row: dict, venue: Optional[Any], authors: Optional[Iterable[Any]]
+    ) -> None:
+        paper_id = row["paperId"]
+        self.rows.papers.append(row)
+
+        if venue is not None and not isinstance(venue, str):
+            venue = _as_dict(venue)
+            if venue.get("id") is not None:
+                self.venues.setdefault(venue["id"], venue_row(venue))
+                self.rows.venue_relations.append(
+                    {"paperId": paper_id, "venueId": venue["id"]}
+                )
+
+        for position, author in enumerate(authors or []):
+            author = _as_dict(author)
+            if author and author["authorId"] is not None:
+                self.authors.setdefault(
+                    author["authorId"],
+                    {"authorId": author["authorId"], "name": author.get("name")},
+                )
+                self.rows.author_relations.append(
+                    {
+                        "paperId": paper_id,
+                        "authorId": author["authorId"],
+                        "position": position,
+                    }
+                )
+
+    def skip(self, reason: str) -> None:
+        self.rows.skipped[reason] = self.rows.skipped.get(reason, 0) + 1
+
+    def build(self) -> BatchRows:
+        self.rows.venues = list(self.venues.values())
+        self.rows.authors = list(self.authors.values())
+        return self.rows
+
+
+def build_batch_rows(papers: List[Paper]) -> BatchRows:
+    builder = _BatchBuilder()
+    for paper in papers:
+        builder.add(paper_row(paper), paper.publicationVenue, paper.authors)
+    return builder.build()
+
+
+def build_record_rows(
+    records: Iterable[Dict[str, Any]], validate: bool = False
+) -> BatchRows:
+    """Build rows directly from raw archive records, without going through
+    Paper. Fields the graph never stores are dropped with the record."""
+    builder = _BatchBuilder()
+    for record in records:
+        if not record.get("paperId"):
+            print("Skipping invalid record: record has no paperId")
+            builder.skip("missing paperId")
+            continue
+        if validate:
+            try:
+                validate_record(record)
+            except ValueError as e:
+                print(f"Skipping invalid record: {e}")
+                builder.skip(type(e).__name__)
+                continue
+        builder.add(
+            record_row(record), record.get("publicationVenue"), record.get("authors")
+        )
+    return builder.build()
+
+
+def split_rows(rows: BatchRows, parts: int) -> List[BatchRows]:
+    """Split a batch into up to `parts` smaller batches by paper, each with
+    the relationships of its papers and the nodes they point to."""
+    size = -(-len(rows.papers) // parts)
+    venues = {venue["id"]: venue for venue in rows.venues}
+    authors = {author["authorId"]: author for author in rows.authors}
+    batches: List[BatchRows] = []
+    for start in range(0, len(rows.papers), size):
+        papers = rows.papers[start : start + size]
+        paper_ids = {paper["paperId"] for paper in papers}
+        venue_relations = [
+            row for row in rows.venue_relations if row["paperId"] in paper_ids
+        ]
+        author_relations = [
+            row for row in rows.author_relations if row["paperId"] in paper_ids
+        ]
+        batches.append(
+            BatchRows(
+                papers=papers,
+                venues=[
+                    venues[venue_id]
+                    for venue_id in dict.fromkeys(
+                        row["venueId"] for row in venue_relations
+                    )
+                ],
+                venue_relations=venue_relations,
+                authors=[
+                    authors[author_id]
+                    for author_id in dict.fromkeys(
+                        row["authorId"] for row in author_relations
+                    )
+                ],
+                author_relations=author_relations,
+            )
+        )
+    return batches
+
+
+def rows_to_records(rows: BatchRows) -> List[dict]:
+    """Rebuild archive records from a batch, so that build_record_rows maps
+    them back to the same rows."""
+    venues = {venue["id"]: venue for venue in rows.venues}
+    authors = {author["authorId"]: author for author in rows.authors}
+    paper_venues = {row["paperId"]: row["venueId"] for row in rows.venue_relations}
+    paper_authors: Dict[str, Dict[int, dict]] = {}
+    for row in rows.author_relations:
+        paper_authors.setdefault(row["paperId"], {})[row["position"]] = authors[
+            row["authorId"]
+        ]
+
+    records: List[dict] = []
+    for paper in rows.papers:
+        record = dict(paper)
+        venue_id = paper_venues.get(paper["paperId"])
+        if venue_id is not None:
+            record["publicationVenue"] = venues[venue_id]
+        # Authors without an id were skipped but still held a position.
+        positions = paper_authors.get(paper["paperId"], {})
+        record["authors"] = [
+            positions.get(position, {"authorId": None, "name": None})
+            for position in range(max(positions, default=-1) + 1)
+        ]
+        records.append(record)
+    return records
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+_STOP = object()
+
+
+class WriteScheduler(Generic[T]):
+    """Sliding window of at most `concurrency` in-flight writes fed by a
+    bounded queue. `submit` blocks once the queue is full, which pushes
+    back on the producer instead of buffering the whole archive."""
+
+    def __init__(
+        self,
+        write: Callable[[T], Awaitable[None]],
+        concurrency: int,
+        queue_size: Optional[int] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least one")
+        self.write = write
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or concurrency * 2)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    async def __aenter__(self) -> "WriteScheduler[T]":
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def submit(self, item: T) -> None:
+        await self.queue.put(item)
+
+    async def close(self) -> None:
+        if self._dispatcher is None:
+            return
+        await self.queue.put(_STOP)
+        await self._dispatcher
+        self._dispatcher = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _dispatch(self) -> None:
+        while True:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            await self.semaphore.acquire()
+            self.in_flight += 1
+            task = asyncio.create_task(self._run(item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, item: T) -> None:
+        try:
+            await self.write(item)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Write failed: {e}")
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+
+def pool_concurrency(max_connection_pool_size: int, requested: Optional[int]) -> int:
+    "In-flight writes never exceed the number of pooled connections."
+    if requested is None:
+        return max_connection_pool_size
+    return max(1, min(requested, max_connection_pool_size))
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from typing import List, Set, Tuple
+
+from neo4j import AsyncDriver
+
+
+class SchemaError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Constraint:
+    name: str
+    label: str
+    property: str
+
+    def create_query(self) -> str:
+        return f"""
+    CREATE CONSTRAINT {self.name} IF NOT EXISTS
+    FOR (n:{self.label}) REQUIRE n.{self.property} IS UNIQUE
+    """
+
+
+@dataclass(frozen=True)
+class Index:
+    name: str
+    label: str
+    property: str
+
+    def create_query(self) -> str:
+        return f"""
+    CREATE INDEX {self.name} IF NOT EXISTS
+    FOR (n:{self.label}) ON (n.{self.property})
+    """
+
+
+# Every MERGE issued by the writers is keyed on one of these properties.
+CONSTRAINTS: List[Constraint] = [
+    Constraint("unique_paper", "Paper", "paperId"),
+    Constraint("unique_author_id", "Author", "authorId"),
+    Constraint("unique_venue", "Venue", "venueId"),
+    Constraint("unique_chunk", "Chunk", "chunkId"),
+]
+
+INDEXES: List[Index] = [
+    Index("paper_external_id_doi", "Paper", "externalIdDoi"),
+    Index("paper_corpus_id", "Paper", "corpusId"),
+    Index("paper_year", "Paper", "year"),
+]
+
+# `unique_author` constrained `a.author`, a property no writer sets, and its
+# name prevents `IF NOT EXISTS` from ever creating the authorId constraint.
+LEGACY_CONSTRAINTS: List[str] = ["unique_author"]
+
+
+async def create_schema(driver: AsyncDriver, database: str) -> None:
+    async with driver.session(database=database) as session:
+        for name in LEGACY_CONSTRAINTS:
+            result = await session.run(f"DROP CONSTRAINT {name} IF EXISTS")
+            await result.consume()
+        for item in [*CONSTRAINTS, *INDEXES]:
+            result = await session.run(item.create_query())
+            await result.consume()
+
+
+async def await_schema(driver: AsyncDriver, database: str, timeout: int = 300) -> None:
+    async with driver.session(database=database) as session:
+        result = await session.run("CALL db.awaitIndexes($timeout)", timeout=timeout)
+        await result.consume()
+
+
+async def online_indexes(driver: AsyncDriver, database: str) -> Set[Tuple[str, str]]:
+    "Return the (label, property) pairs backed by an online single-property index."
+    async with driver.session(database=database) as session:
+        result = await session.run(
+            """
+            SHOW INDEXES
+            YIELD entityType, labelsOrTypes, properties, state
+            WHERE entityType = 'NODE' AND state = 'ONLINE'
+            RETURN labelsOrTypes, properties
+            """
+        )
+        indexes = set()
+        async for record in result:
+            labels, properties = record["labelsOrTypes"], record["properties"]
+            if labels and properties and len(properties) == 1:
+                indexes.update((label, properties[0]) for label in labels)
+        return indexes
+
+
+async def verify_schema(driver: AsyncDriver, database: str) -> None:
+    "Refuse to bulk load while a MERGE key or lookup property has no index."
+    indexes = await online_indexes(driver, database)
+    missing = [
+        f"{item.label}.{item.property}"
+        for item in [*CONSTRAINTS, *INDEXES]
+        if (item.label, item.property) not in indexes
+    ]
+    if missing:
+        raise SchemaError(f"Missing online indexes for {', '.join(missing)}")
+
+
+async def prepare_schema(
+    driver: AsyncDriver, database: str, create: bool = True, timeout: int = 300
+) -> None:
+    if create:
+        await create_schema(driver, database)
+    await await_schema(driver, database, timeout)
+    await verify_schema(driver, database)
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor
+from typing import (
+    AsyncGenerator,
+    Deque,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from ingestion.rows import BatchRows, build_record_rows
+
+K = TypeVar("K")
+
+
+def transform_batch(items: List[Union[str, dict]], validate: bool = False) -> BatchRows:
+    "Parse, optionally validate and flatten raw records into ready-to-send rows."
+    start = time.perf_counter()
+    records: List[dict] = []
+    invalid: Counter = Counter()
+    for item in items:
+        if isinstance(item, str):
+            try:
+                item = json.loads(item)
+            except ValueError as e:
+                print(f"Skipping invalid record: {e}")
+                invalid[type(e).__name__] += 1
+                continue
+        records.append(item)
+    parsed = time.perf_counter()
+    rows = build_record_rows(records, validate)
+    rows.timings["parse"] = parsed - start
+    rows.timings["build"] = time.perf_counter() - parsed
+    for reason, count in invalid.items():
+        rows.skipped[reason] = rows.skipped.get(reason, 0) + count
+    return rows
+
+
+async def transform_batches(
+    batches: Iterable[Tuple[K, List[Union[str, dict]]]],
+    pool: Optional[Executor] = None,
+    depth: int = 1,
+    validate: bool = False,
+) -> AsyncGenerator[Tuple[K, BatchRows], None]:
+    """Yield `(key, rows)` for each keyed batch, in order. With a pool, up to
+    `depth` batches are transformed ahead of the consumer in worker
+    processes."""
+    if pool is None:
+        for key, batch in batches:
+            yield key, transform_batch(batch, validate)
+        return
+
+    loop = asyncio.get_running_loop()
+    pending: Deque[Tuple[K, asyncio.Future]] = deque()
+    for key, batch in batches:
+        future = loop.run_in_executor(pool, transform_batch, batch, validate)
+        pending.append((key, future))
+        if len(pending) >= depth:
+            key, future = pending.popleft()
+            yield key, await future
+    while pending:
+        key, future = pending.popleft()
+        yield key, await future
@@ -2,20 +2,20 @@ from dataclasses import dataclass, asdict
 from typing import Optional, List
 
 
-@dataclass
+@dataclass(slots=True)
 class ExternalIds:
     MAG: str
     DOI: str
     CorpusId: int
 
 
-@dataclass
+@dataclass(slots=True)
 class OpenAccessPdf:
     url: str
     status: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Journal:
     name: str
     pages: str
@@ -25,12 +25,12 @@ class Journal:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class CitationStyles:
     bibtex: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Author:
     authorId: str
     name: str
@@ -39,13 +39,13 @@ class Author:
         return asdict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class S2FieldOfStudy:
     category: str
     source: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Venue:
     id: str
     name: str
@@ -57,7 +57,7 @@ class Venue:
     type: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Paper:
     paperId: str
     externalIds: ExternalIds
@@ -75,23 +75,25 @@ class Paper:
     openAccessPdf: OpenAccessPdf
     fieldsOfStudy: List[str]
     s2FieldsOfStudy: List[S2FieldOfStudy]
-    publicationTypes: Optional[str]
+    publicationTypes: Optional[List[str]]
     publicationDate: str
     journal: Journal
     citationStyles: CitationStyles
     authors: List[Author]
 
     def to_dict(self):
-        publicationVenue = (
-            self.publicationVenue
-            if isinstance(self.publicationVenue, Venue)
-            else self.publicationVenue
-        )
+        # Only the fields create_paper_query reads; authors, venues,
+        # s2FieldsOfStudy, journal and citationStyles are never stored on
+        # the Paper node.
         return {
             "paperId": self.paperId,
             "externalIds": self.externalIds,
             "corpusId": self.corpusId,
-            "publicationVenue": publicationVenue,
+            "publicationVenue": (
+                self.publicationVenue
+                if isinstance(self.publicationVenue, str)
+                else None
+            ),
             "url": self.url,
             "title": self.title,
             "abstract": self.abstract,
@@ -103,10 +105,6 @@ class Paper:
             "isOpenAccess": self.isOpenAccess,
             "openAccessPdf": self.openAccessPdf,
             "fieldsOfStudy": self.fieldsOfStudy,
-            "s2FieldsOfStudy": [s2 for s2 in self.s2FieldsOfStudy],
             "publicationTypes": self.publicationTypes,
             "publicationDate": self.publicationDate,
-            # "journal": self.journal.to_dict(),
-            "citationStyles": self.citationStyles,
-            "authors": self.authors,
         }
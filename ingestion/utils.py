@@ -1,8 +1,20 @@
-from typing import Generator, Iterable, TypeVar
+import os
+from typing import Dict, Generator, Iterable, List, Optional, Tuple, TypeVar
 from itertools import islice
 
 T = TypeVar("T")
 
+# In order of preference when a directory holds copies of one archive.
+ARCHIVE_EXTENSIONS = (
+    ".parquet",
+    ".jsonl",
+    ".jsonl.gz",
+    ".jsonl.zst",
+    ".json",
+    ".json.gz",
+    ".json.zst",
+)
+
 
 def batched(iterable: Iterable[T], n: int) -> Generator[list[T], None, None]:
     "Batch data into tuples of length n. The last batch may be shorter."
@@ -12,3 +24,30 @@ def batched(iterable: Iterable[T], n: int) -> Generator[list[T], None, None]:
     it = iter(iterable)
     while batch := list(islice(it, n)):
         yield batch
+
+
+def archive_extension(file: str) -> Optional[str]:
+    for extension in ARCHIVE_EXTENSIONS:
+        if file.endswith(extension):
+            return extension
+    return None
+
+
+def get_files(path: str) -> List[str]:
+    """Archives in `path`, or `path` itself if it is a file. get_dataset.py
+    can write copies of an archive next to it, so only the preferred
+    extension of each file stem is returned."""
+    files: List[str] = []
+    if os.path.isdir(path):
+        archives: Dict[str, Tuple[int, str]] = {}
+        for file in os.listdir(path):
+            extension = archive_extension(file)
+            if extension is None:
+                continue
+            stem = file[: -len(extension)]
+            candidate = (ARCHIVE_EXTENSIONS.index(extension), file)
+            archives[stem] = min(archives.get(stem, candidate), candidate)
+        files = [os.path.join(path, archives[stem][1]) for stem in sorted(archives)]
+    elif os.path.isfile(path):
+        files.append(path)
+    return files
@@ -1,66 +1,204 @@
 import requests
+import gzip
 import json
 import os
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from urllib3 import PoolManager
+from urllib3.exceptions import HTTPError
 from urllib3.util.retry import Retry
 
+from ingestion.reader import iter_jsonl, iter_records, open_archive, strip_compression
+from search_bulk.manifest import Manifest
+from search_bulk.rate_limit import TokenBucket, retry_delay
+
 retries = Retry(connect=5, read=2, redirect=5)
 
 session = requests.Session()
 retry = Retry(connect=3, backoff_factor=0.5)
 http = PoolManager(retries=retries)
 
+# Shared by every worker thread; replaced from --rate below.
+limiter = TokenBucket(rate=1.0)
+
+S2_API_KEY = os.getenv("S2_API_KEY")
+headers = {"x-api-key": S2_API_KEY} if S2_API_KEY else {}
+
+
+def request_and_retry_timeout(url: str, retries: int = 8) -> dict | None:  # type: ignore
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        retry_after = None
+        try:
+            response = http.request("GET", url, headers=headers)
+            if response.status == 429 or response.status >= 500:
+                retry_after = response.headers.get("Retry-After")
+                print(f"HTTP {response.status} from {url}")
+            else:
+                return json.loads(response.data.decode("utf-8"))
+        except (HTTPError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"Request to {url} failed: {e}")
+        if attempt < retries:
+            time.sleep(retry_delay(attempt, retry_after))
+    return None
+
+
+def state_file_name(file_name: str) -> str:
+    return f"{file_name}.state"
+
+
+def load_state(file_name: str) -> dict | None:  # type: ignore
+    state_file = state_file_name(file_name)
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, "r") as file:
+        return json.load(file)
+
+
+def save_state(file_name: str, state: dict):
+    # Written to a temporary file first so a crash never leaves a torn state.
+    state_file = state_file_name(file_name)
+    with open(f"{state_file}.tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(f"{state_file}.tmp", state_file)
+
+
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
 
-def request_and_retry_timeout(url: str, retries: int = 3) -> dict | None:  # type: ignore
-    response = http.request("GET", url)
-    return json.loads(response.data.decode("utf-8"))
 
+def encode_page(data: bytes, compression: str) -> bytes:
+    # Each page is a self-contained gzip member / zstd frame, so the archive
+    # stays valid after every page and can be truncated back to any page.
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("--compress zstd requires the zstandard package")
+        return zstandard.ZstdCompressor().compress(data)
+    return data
 
-def get_papers_metadata(file_name: str, response: dict, url: str):  # type: ignore
-    with open(file_name, "a") as file:
-        retrieved: int = 0
+
+def get_papers_metadata(
+    file_name: str,
+    url: str,
+    compression: str = "none",
+    manifest: Manifest | None = None,
+):  # type: ignore
+    """Page through the results into `file_name`, checkpointing the
+    continuation token, record count and file offset after every page so
+    an interrupted run resumes at the next page. With a manifest, only new
+    or changed records are written."""
+    state = load_state(file_name) or {
+        "token": None,
+        "retrieved": 0,
+        "emitted": 0,
+        "offset": 0,
+    }
+    if state.get("done"):
+        return state
+    with open(file_name, "ab") as file:
+        file.truncate(state["offset"])
+        file.seek(state["offset"])
+        if state["retrieved"]:
+            print(f"{file_name}: resuming after {state['retrieved']} papers")
         while True:
-            if "data" in response:
-                retrieved += len(response["data"])
-                print(f"Retrieved {retrieved} papers...")
-                for paper in response["data"]:
-                    print(json.dumps(paper), file=file)
-            elif "token" not in response:
-                break
-            response = request_and_retry_timeout(f"{url}&token={response['token']}")
-        pass
-
-
-def create_file_name(start_year: int, end_year: int):
+            page_url = (
+                url if state["token"] is None else f"{url}&token={state['token']}"
+            )
+            response = request_and_retry_timeout(page_url)
+            if response is None or "error" in response:
+                print(response)
+                raise RuntimeError(f"Failed to retrieve {page_url}")
+            papers = response.get("data", [])
+            if manifest is not None:
+                papers = manifest.changed(papers)
+            page = "".join(json.dumps(paper) + "\n" for paper in papers)
+            if page:
+                file.write(encode_page(page.encode("utf-8"), compression))
+            file.flush()
+            os.fsync(file.fileno())
+            state["retrieved"] += len(response.get("data", []))
+            state["token"] = response.get("token")
+            state["offset"] = file.tell()
+            state["total"] = response.get("total", state.get("total"))
+            state["done"] = not state["token"]
+            state["emitted"] = state.get("emitted", 0) + len(papers)
+            save_state(file_name, state)
+            # Recorded after the page is durable: a crash in between only
+            # re-emits the page, it never drops a change.
+            if manifest is not None:
+                manifest.update(papers)
+            print(
+                f"{file_name}: retrieved {state['retrieved']} papers,",
+                f"wrote {state['emitted']}...",
+            )
+            if state["done"]:
+                return state
+
+
+def create_file_name(
+    start_year: int,
+    end_year: int,
+    compression: str = "none",
+    delta_tag: str | None = None,
+):
     file_name = (
-        f"papers-{start_year}.jsonl"
+        f"papers-{start_year}"
         if (start_year == end_year)
-        else f"papers-{start_year}-{end_year }.jsonl"
+        else f"papers-{start_year}-{end_year }"
     )
-    return file_name
+    if delta_tag:
+        file_name += f".delta-{delta_tag}"
+    return file_name + ".jsonl" + COMPRESSION_SUFFIXES[compression]
 
 
 def search_paper_by_fields_years(
-    fields: str, fieldsOfStudy: str, start_year: int, end_year: int, file_name: str
+    fields: str,
+    fieldsOfStudy: str,
+    start_year: int,
+    end_year: int,
+    file_name: str,
+    compression: str = "none",
+    manifest: Manifest | None = None,
 ):
     url = f"http://api.semanticscholar.org/graph/v1/paper/search/bulk?fields={fields}&year={start_year}-{end_year}&fieldsOfStudy={fieldsOfStudy}&openAccessPdf"
-    r = request_and_retry_timeout(url)
-    if r is None or "error" in r:
-        print(f"Failed to retrieve papers for {start_year} - {end_year}")
-        print(r)
-        exit(1)
-    else:
-        get_papers_metadata(file_name, r, url)
-        print(f"{start_year} - {end_year} {r['total']}")
+    state = get_papers_metadata(file_name, url, compression, manifest)
+    print(f"{start_year} - {end_year} {state.get('total')}")
+
+
+def json_file_name_for(file_name: str) -> str:
+    return strip_compression(file_name).replace(".jsonl", ".json")
 
 
 def convert_jsonl_to_json(file_name: str):
-    with open(file_name, "r") as file:
-        data = file.readlines()
-        data = [json.loads(d) for d in data]
-    with open(file_name.replace(".jsonl", ".json"), "w") as file:
-        json.dump(data, file)
+    "Stream a (possibly compressed) JSONL archive into a JSON array file."
+    json_file_name = json_file_name_for(file_name)
+    with open_archive(file_name) as source, open(f"{json_file_name}.tmp", "w") as file:
+        file.write("[")
+        for index, line in enumerate(iter_jsonl(source, raw=True)):
+            if index:
+                file.write(",\n")
+            file.write(line)
+        file.write("]\n")
+    os.replace(f"{json_file_name}.tmp", json_file_name)
+
+
+def parquet_file_name_for(file_name: str) -> str:
+    return strip_compression(file_name).replace(".jsonl", ".parquet")
+
+
+def convert_jsonl_to_parquet(file_name: str):
+    "Stream a (possibly compressed) JSONL archive into Parquet row groups."
+    from ingestion.columnar import write_parquet
+
+    parquet_file_name = parquet_file_name_for(file_name)
+    count = write_parquet(iter_records(file_name), f"{parquet_file_name}.tmp")
+    os.replace(f"{parquet_file_name}.tmp", parquet_file_name)
+    print(f"Wrote {count} papers to {parquet_file_name}")
 
 
 def trigger(
@@ -70,20 +208,43 @@ def trigger(
     fieldsOfStudy: str,
     force: bool,
     destination: str,
+    compression: str = "none",
+    to_json: bool = False,
+    to_parquet: bool = False,
+    manifest: Manifest | None = None,
+    delta_tag: str | None = None,
 ):
     print("Searching papers for years", start_year, end_year)
-    file_name = create_file_name(start_year, end_year)
+    file_name = create_file_name(start_year, end_year, compression, delta_tag)
     file_name = os.path.join(destination, file_name)
-    if force and os.path.exists(file_name):
-        os.remove(file_name)
-    if not force and os.path.exists(file_name):
+    json_file_name = json_file_name_for(file_name)
+    parquet_file_name = parquet_file_name_for(file_name)
+    if force:
+        for name in [
+            file_name,
+            state_file_name(file_name),
+            json_file_name,
+            parquet_file_name,
+        ]:
+            if os.path.exists(name):
+                os.remove(name)
+    state = load_state(file_name)
+    if state is not None and state.get("done") and os.path.exists(file_name):
         print(f"File for {start_year} - {end_year} already exists, skipping...")
     else:
         search_paper_by_fields_years(
-            fields, fieldsOfStudy, start_year, end_year, file_name
+            fields,
+            fieldsOfStudy,
+            start_year,
+            end_year,
+            file_name,
+            compression,
+            manifest,
         )
+    if to_json and not os.path.exists(json_file_name):
         convert_jsonl_to_json(file_name)
-        os.remove(file_name)
+    if to_parquet and not os.path.exists(parquet_file_name):
+        convert_jsonl_to_parquet(file_name)
     start_year += jump
 
 
@@ -101,6 +262,45 @@ parser.add_argument("destination", type=str, help="Destination folder", default=
 parser.add_argument(
     "--force", action="store_true", help="Force overwrite", default=False
 )
+parser.add_argument(
+    "--workers", type=int, default=4, help="Year ranges fetched concurrently"
+)
+parser.add_argument(
+    "--rate",
+    type=float,
+    default=1.0,
+    help="Requests per second shared by all workers",
+)
+parser.add_argument(
+    "--compress",
+    choices=sorted(COMPRESSION_SUFFIXES),
+    default="none",
+    help="Compress the JSONL archive while pages arrive",
+)
+parser.add_argument(
+    "--json",
+    action="store_true",
+    help="Also write a JSON array copy of each archive",
+    default=False,
+)
+parser.add_argument(
+    "--parquet",
+    action="store_true",
+    help="Also write a Parquet copy of each archive (requires pyarrow)",
+    default=False,
+)
+parser.add_argument(
+    "--incremental",
+    type=str,
+    default=None,
+    help="Manifest database; only papers new or changed since the last run are written",
+)
+parser.add_argument(
+    "--delta-tag",
+    type=str,
+    default=date.today().strftime("%Y%m%d"),
+    help="Suffix of incremental archives (defaults to today's date)",
+)
 
 args = parser.parse_args()
 start_year_bulk = args.start_year
@@ -108,6 +308,10 @@ end_year_bulk = args.end_year
 jump = args.jump
 force = args.force
 destination = args.destination
+limiter = TokenBucket(rate=args.rate)
+http = PoolManager(retries=retries, maxsize=max(1, args.workers))
+manifest = Manifest(args.incremental) if args.incremental else None
+delta_tag = args.delta_tag if args.incremental else None
 
 
 if not os.path.exists(destination):
@@ -130,9 +334,47 @@ elif jump - 1 > end_year_bulk - start_year_bulk:
     exit()
 
 elif start_year_bulk == end_year_bulk:
-    trigger(start_year_bulk, end_year_bulk, fields, fieldsOfStudy, force, destination)
+    trigger(
+        start_year_bulk,
+        end_year_bulk,
+        fields,
+        fieldsOfStudy,
+        force,
+        destination,
+        args.compress,
+        args.json,
+        args.parquet,
+        manifest,
+        delta_tag,
+    )
 
 else:
-    for start_year in range(start_year_bulk, end_year_bulk, jump):
-        end_year = start_year + jump - 1
-        trigger(start_year, end_year, fields, fieldsOfStudy, force, destination)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [
+            executor.submit(
+                trigger,
+                start_year,
+                start_year + jump - 1,
+                fields,
+                fieldsOfStudy,
+                force,
+                destination,
+                args.compress,
+                args.json,
+                args.parquet,
+                manifest,
+                delta_tag,
+            )
+            for start_year in range(start_year_bulk, end_year_bulk, jump)
+        ]
+        # A failed range stops on its own; the others keep their progress.
+        failed = 0
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(e)
+    if failed:
+        print(f"{failed} year ranges failed, run again to resume them")
+        exit(1)
@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import threading
+from hashlib import blake2b
+from typing import Dict, List
+
+
+def record_hash(record: dict) -> bytes:
+    data = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return blake2b(data.encode("utf-8"), digest_size=16).digest()
+
+
+class Manifest:
+    """SQLite map of paperId to the hash of the record last emitted for it.
+
+    Shared by the fetch threads, so every access goes through one lock."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS papers (paperId TEXT PRIMARY KEY, hash BLOB NOT NULL)"
+        )
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def changed(self, records: List[dict]) -> List[dict]:
+        "Return the records that are new or differ from the manifest."
+        hashes = {record["paperId"]: record_hash(record) for record in records}
+        if not hashes:
+            return []
+        paper_ids = list(hashes)
+        known: Dict[str, bytes] = {}
+        with self.lock:
+            # Stay below SQLite's default limit of 999 bound parameters.
+            for start in range(0, len(paper_ids), 900):
+                chunk = paper_ids[start : start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                known.update(
+                    self.connection.execute(
+                        f"SELECT paperId, hash FROM papers WHERE paperId IN ({placeholders})",
+                        chunk,
+                    )
+                )
+        return [
+            record
+            for record in records
+            if known.get(record["paperId"]) != hashes[record["paperId"]]
+        ]
+
+    def update(self, records: List[dict]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO papers (paperId, hash) VALUES (?, ?)",
+                [(record["paperId"], record_hash(record)) for record in records],
+            )
@@ -0,0 +1,139 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from urllib3 import PoolManager
+from urllib3.exceptions import HTTPError
+
+from search_bulk.rate_limit import TokenBucket, retry_delay
+
+BATCH_URL = "https://api.semanticscholar.org/graph/v1/paper/batch"
+# The batch endpoint rejects requests with more ids than this.
+MAX_BATCH_IDS = 500
+
+
+class ReferenceCache:
+    """SQLite map of paperId to the paperIds it references, as returned by
+    the API. Papers are only fetched once, however often the stage runs.
+
+    Shared by the fetch threads, so every access goes through one lock."""
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS paper_references (
+                paperId TEXT PRIMARY KEY,
+                refs TEXT NOT NULL,
+                fetched REAL NOT NULL
+            )
+            """
+        )
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get_many(self, paper_ids: List[str]) -> Dict[str, List[str]]:
+        found: Dict[str, List[str]] = {}
+        unique = list(dict.fromkeys(paper_ids))
+        with self.lock:
+            # Stay below SQLite's default limit of 999 bound parameters.
+            for start in range(0, len(unique), 900):
+                chunk = unique[start : start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                for paper_id, refs in self.connection.execute(
+                    f"SELECT paperId, refs FROM paper_references WHERE paperId IN ({placeholders})",
+                    chunk,
+                ):
+                    found[paper_id] = json.loads(refs)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, references: Dict[str, List[str]]) -> None:
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO paper_references (paperId, refs, fetched) VALUES (?, ?, ?)",
+                [
+                    (paper_id, json.dumps(refs), now)
+                    for paper_id, refs in references.items()
+                ],
+            )
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{rate:.1%} hit rate ({self.hits} papers not re-fetched)"
+
+
+class ReferenceClient:
+    """Fetches references through `POST /paper/batch`, at most
+    `MAX_BATCH_IDS` papers per request. Thread-safe: every request takes a
+    token from the shared `limiter` first."""
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        connections: int = 4,
+        retries: int = 8,
+        api_key: Optional[str] = None,
+    ):
+        self.limiter = limiter
+        self.retries = retries
+        self.http = PoolManager(maxsize=max(1, connections))
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["x-api-key"] = api_key
+
+    def request(self, paper_ids: List[str]) -> Optional[list]:
+        url = f"{BATCH_URL}?fields=references.paperId"
+        body = json.dumps({"ids": paper_ids})
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            retry_after = None
+            try:
+                response = self.http.request(
+                    "POST", url, body=body, headers=self.headers
+                )
+                if response.status == 429 or response.status >= 500:
+                    retry_after = response.headers.get("Retry-After")
+                    print(f"HTTP {response.status} from {BATCH_URL}")
+                elif response.status >= 400:
+                    print(
+                        f"HTTP {response.status} from {BATCH_URL}: {response.data[:200]}"
+                    )
+                    return None
+                else:
+                    return json.loads(response.data.decode("utf-8"))
+            except (HTTPError, UnicodeDecodeError, json.JSONDecodeError) as e:
+                print(f"Request to {BATCH_URL} failed: {e}")
+            if attempt < self.retries:
+                time.sleep(retry_delay(attempt, retry_after))
+        return None
+
+    def fetch(self, paper_ids: Iterable[str]) -> Optional[Dict[str, List[str]]]:
+        """Map each paperId to the paperIds it references, or return None if
+        the request kept failing. Unknown papers and references the API
+        could not resolve to a paper are left out."""
+        paper_ids = list(paper_ids)
+        if len(paper_ids) > MAX_BATCH_IDS:
+            raise ValueError(f"At most {MAX_BATCH_IDS} ids per batch request")
+        papers = self.request(paper_ids)
+        if papers is None:
+            return None
+        references: Dict[str, List[str]] = {}
+        # The response lists the papers in request order, null when unknown.
+        for paper_id, paper in zip(paper_ids, papers):
+            references[paper_id] = [
+                reference["paperId"]
+                for reference in (paper or {}).get("references") or []
+                if reference.get("paperId")
+            ]
+        return references